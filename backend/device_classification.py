@@ -1,206 +1,459 @@
 import pandas as pd
 import numpy as np
+import functools
+import hashlib
 import json
-from scapy.all import rdpcap, Dot11
+import mmap
+import os
+import struct
+from scapy.all import RawPcapReader, Dot11, conf
 
+from modules.trigger_windows import classify_windows, count_triggers_per_bucket, map_devices
 
-# Feature Extraction
-
-def extract_features_for_mac_pair(packets, mac1, mac2, label, window_size=1.0):
-    pkt_list = []
-    t0 = float(packets[0].time)
-    last_pkt_time = None
 
-    # Define pattern: 24,10 repeated 5 times
-    PATTERN = [24, 10] * 5
-    PATTERN_LEN = len(PATTERN)
+# Parsed captures are cached here, keyed by capture_cache_key()
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".pcap_cache")
+CACHE_VERSION = 1
 
-    # Temporary list to store lengths to detect consecutive pattern
-    length_buffer = []
+# Classic pcap magic → (byte order, timestamp ticks per second)
+PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 10 ** 6),
+    b"\xa1\xb2\xc3\xd4": (">", 10 ** 6),
+    b"\x4d\x3c\xb2\xa1": ("<", 10 ** 9),
+    b"\xa1\xb2\x3c\x4d": (">", 10 ** 9),
+}
+LINKTYPE_IEEE802_11 = 105
 
-    for pkt in packets:
-        if not pkt.haslayer(Dot11):
-            continue
+# Scapy keeps at most this many bytes of a record
+MAX_FRAME_LEN = 65535
 
-        dot11 = pkt[Dot11]
-        src, dst = dot11.addr2, dot11.addr1
+# Packed addresses: big-endian weights of the 6 octets, and a code outside the
+# 48-bit range for frames without addr2
+MAC_OCTET_WEIGHTS = np.array([1 << (8 * k) for k in range(5, -1, -1)], dtype=np.uint64)
+NO_MAC_CODE = np.uint64(1 << 48)
 
-        # Device-specific MAC filtering
-        if label == "air_purifier":
-            if ((src, dst) not in [(mac1, mac2), (mac2, mac1)]) and (dst != mac1):
-                continue
-        else:
-            if (src, dst) not in [(mac1, mac2), (mac2, mac1)]:
-                continue
+# Control (1) / extension (3) subtypes whose header still carries addr2
+ADDR2_SUBTYPES = frozenset({4, 5, 6, 8, 9, 10, 11, 14, 15})
 
-        frame_len = len(pkt)
 
-        # Push frame length into buffer
-        length_buffer.append(frame_len)
-        if len(length_buffer) > PATTERN_LEN:
-            length_buffer.pop(0)
+# Feature Extraction
 
-        # Check pattern match → ref1 = 1
-        pattern_match = (length_buffer == PATTERN)
+# Define pattern: 24,10 repeated 5 times
+PATTERN = np.array([24, 10] * 5, dtype=np.int32)
+PATTERN_LEN = len(PATTERN)
+
+# Frame lengths that raise ref / ref2
+REF_LENS = np.array([269, 91], dtype=np.int32)
+REF2_LENS = np.array([301, 269, 317], dtype=np.int32)
+
+
+def load_packet_table(pcap_file):
+    """
+    Read the capture once and keep only the Dot11 fields the features use,
+    as parallel arrays (times are relative to the first packet).
+
+    Raw 802.11 pcaps (what airodump-ng writes) are walked directly over an
+    mmap; anything else goes through Scapy.
+    """
+    with open(pcap_file, "rb") as f:
+        header = f.read(24)
+        if len(header) == 24 and header[:4] in PCAP_MAGIC:
+            endian, ticks = PCAP_MAGIC[header[:4]]
+            linktype = struct.unpack(endian + "I", header[20:24])[0]
+            if linktype == LINKTYPE_IEEE802_11:
+                if os.fstat(f.fileno()).st_size == 24:
+                    return _pack_packet_table([], [], [], [], None)
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    return _walk_dot11_pcap(buf, endian, ticks)
+
+    return _load_packet_table_scapy(pcap_file)
+
+
+def _walk_dot11_pcap(buf, endian, ticks):
+    """
+    Walk pcap records of raw 802.11 frames, decoding only the MAC header.
+
+    A frame is kept exactly when Scapy's Dot11 dissection would succeed, i.e.
+    every header field present for its type/subtype fits in the record.
+    """
+    unpack_record = struct.Struct(endian + "IIII").unpack_from
+
+    # Every record takes at least a 16-byte header, which bounds the count;
+    # np.empty only commits the pages that actually get written
+    size = len(buf)
+    capacity = max(0, (size - 24) // 16)
+    stamps = np.empty(capacity, dtype=np.float64)
+    lens = np.empty(capacity, dtype=np.int32)
+    starts = np.empty(capacity, dtype=np.int64)
+    has_src = np.empty(capacity, dtype=np.bool_)
+    first_stamp = None
+
+    n = 0
+    pos = 24
+    while pos + 16 <= size:
+        sec, frac, caplen, _ = unpack_record(buf, pos)
+        start = pos + 16
+        pos = start + caplen
+
+        # Same float as float(pkt.time), see _load_packet_table_scapy
+        stamp = (sec * ticks + frac) / ticks
+        if first_stamp is None:
+            first_stamp = stamp
+
+        frame_len = min(caplen, size - start, MAX_FRAME_LEN)
+        if frame_len == 0:
+            # Scapy dissects an empty record as a default (all-zero) Dot11 header
+            stamps[n] = stamp
+            lens[n] = 0
+            starts[n] = start
+            has_src[n] = True
+            n += 1
+            continue
+        if frame_len < 10:
+            continue
 
-        # OLD ref1 rule replaced with NEW pattern logic
-        ref1 = 1 if pattern_match else 0
+        fc0 = buf[start]
+        fc1 = buf[start + 1]
+        ftype = (fc0 >> 2) & 3
+        subtype = fc0 >> 4
+
+        # Header bytes Scapy needs: FC+ID+addr1, then optional addr2/addr3/SC/addr4
+        has_addr2 = ftype not in (1, 3) or subtype in ADDR2_SUBTYPES
+        if ftype == 2 and fc1 & 3 == 3:
+            need = 30
+        elif ftype in (0, 2):
+            need = 24
+        elif ftype == 1 and subtype == 6 and fc1 >> 4 == 6:
+            need = 22
+        elif has_addr2:
+            need = 16
+        else:
+            need = 10
+        if frame_len < need:
+            continue
 
-        # ref rule (unchanged)
-        ref = 1 if frame_len in [269, 91] else 0
+        stamps[n] = stamp
+        lens[n] = frame_len
+        starts[n] = start
+        has_src[n] = has_addr2
+        n += 1
+
+    stamps = stamps[:n]
+    lens = lens[:n]
+    starts = starts[:n]
+    has_src = has_src[:n]
+
+    # Gather addr1/addr2 for all kept frames at once (empty frames stay zero)
+    dst_codes = np.zeros(n, dtype=np.uint64)
+    src_codes = np.zeros(n, dtype=np.uint64)
+    frames = np.frombuffer(buf, dtype=np.uint8)
+    try:
+        body = np.flatnonzero(lens > 0)
+        dst_codes[body] = _mac_codes(frames, starts[body] + 4)
+        with_src = body[has_src[body]]
+        src_codes[with_src] = _mac_codes(frames, starts[with_src] + 10)
+    finally:
+        del frames  # release the mmap export before the caller closes it
+    src_codes[~has_src] = NO_MAC_CODE
+
+    return _pack_packet_table(stamps, lens, _mac_strings(src_codes),
+                              _mac_strings(dst_codes), first_stamp)
+
+
+def _mac_codes(frames, offsets):
+    """48-bit integers of the 6 address bytes at each offset."""
+    octets = frames[offsets[:, None] + np.arange(6)].astype(np.uint64)
+    return octets @ MAC_OCTET_WEIGHTS
+
+
+def _mac_strings(codes):
+    """Colon-hex MAC per code, formatting each distinct address only once."""
+    uniq, inverse = np.unique(codes, return_inverse=True)
+    names = np.array(
+        ["" if c == NO_MAC_CODE else int(c).to_bytes(6, "big").hex(":") for c in uniq],
+        dtype="U17",
+    )
+    return names[inverse.reshape(-1)]
+
+
+def _load_packet_table_scapy(pcap_file):
+    """load_packet_table() for captures the raw walker does not handle."""
+    stamps = []
+    lens = []
+    srcs = []
+    dsts = []
+    first_stamp = None
+
+    with RawPcapReader(pcap_file) as reader:
+        ll_cls = conf.l2types.num2layer.get(reader.linktype, conf.raw_layer)
+        ticks = 10 ** 9 if reader.nano else 10 ** 6
+
+        for data, meta in reader:
+            # Integer ticks / ticks is the correctly rounded sec.usec, i.e. the
+            # same float as float(pkt.time) without building an EDecimal
+            stamp = (meta.sec * ticks + meta.usec) / ticks
+            if first_stamp is None:
+                first_stamp = stamp
+
+            try:
+                pkt = ll_cls(data)
+            except Exception:
+                continue
+            if not pkt.haslayer(Dot11):
+                continue
 
-        # ref2 rule (unchanged)
-        ref2 = 1 if frame_len in [301, 269, 317] else 0
+            dot11 = pkt[Dot11]
+            stamps.append(stamp)
+            lens.append(len(data))
+            srcs.append(dot11.addr2 or "")
+            dsts.append(dot11.addr1 or "")
+
+    return _pack_packet_table(stamps, lens, srcs, dsts, first_stamp)
+
+
+def _pack_packet_table(stamps, lens, srcs, dsts, first_stamp):
+    times = np.asarray(stamps, dtype=np.float64)
+    if first_stamp is not None:
+        times -= first_stamp
+
+    return {
+        "time": times,
+        "frame_len": np.asarray(lens, dtype=np.int32),
+        "src_mac": np.asarray(srcs, dtype="U17"),
+        "dst_mac": np.asarray(dsts, dtype="U17"),
+    }
+
+
+def capture_cache_key(pcap_file):
+    """Identify a capture by its first 64 KiB, size and mtime."""
+    st = os.stat(pcap_file)
+    h = hashlib.blake2b(digest_size=16)
+    with open(pcap_file, "rb") as f:
+        h.update(f.read(65536))
+    h.update(f"{st.st_size}:{st.st_mtime_ns}:{CACHE_VERSION}".encode())
+    return h.hexdigest()
+
+
+def load_packet_table_cached(pcap_file, cache_dir=CACHE_DIR):
+    """load_packet_table(), memoized on disk so re-analysis skips the pcap parse."""
+    if not cache_dir:
+        return load_packet_table(pcap_file)
+
+    cache_path = os.path.join(cache_dir, capture_cache_key(pcap_file) + ".npz")
+    if os.path.exists(cache_path):
+        try:
+            with np.load(cache_path) as data:
+                return {k: data[k] for k in data.files}
+        except (OSError, ValueError):
+            pass  # unreadable entry → parse again and overwrite it
+
+    packets = load_packet_table(pcap_file)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = cache_path + ".tmp.npz"
+    np.savez(tmp_path, **packets)
+    os.replace(tmp_path, cache_path)
+    return packets
+
+
+def match_pattern(lens):
+    """Flag each frame whose last PATTERN_LEN lengths (itself included) equal PATTERN."""
+    n = len(lens)
+    hits = np.zeros(n, dtype=bool)
+    if n < PATTERN_LEN:
+        return hits
+
+    # match[k] covers lens[k : k + PATTERN_LEN]; AND one shifted compare at a time
+    # into a single buffer instead of materialising an N x PATTERN_LEN window view
+    span = n - PATTERN_LEN + 1
+    match = lens[:span] == PATTERN[0]
+    for k in range(1, PATTERN_LEN):
+        match &= lens[k:k + span] == PATTERN[k]
+
+    hits[PATTERN_LEN - 1:] = match
+    return hits
+
+
+def build_packet_index(packets):
+    """
+    Group packet positions by (src, dst) pair and by dst in one pass over the
+    table, so each device looks up its packets instead of rescanning all of them.
+    """
+    n = len(packets["time"])
+    macs, codes = np.unique(
+        np.concatenate((packets["src_mac"], packets["dst_mac"])), return_inverse=True
+    )
+    src_code, dst_code = codes[:n], codes[n:]
+
+    def group(keys):
+        order = np.argsort(keys, kind="stable")
+        uniq, first = np.unique(keys[order], return_index=True)
+        return dict(zip(uniq.tolist(), np.split(order, first[1:])))
+
+    return {
+        "mac_code": {mac: i for i, mac in enumerate(macs.tolist())},
+        "n_macs": len(macs),
+        "pairs": group(src_code * len(macs) + dst_code),
+        "dst": group(dst_code),
+    }
+
+
+def select_device_packets(packet_index, mac1, mac2, label):
+    """Positions (in capture order) of the packets a device's features use."""
+    code1 = packet_index["mac_code"].get(mac1)
+    code2 = packet_index["mac_code"].get(mac2)
+    n_macs = packet_index["n_macs"]
+    parts = []
+
+    # Device-specific MAC filtering
+    if code1 is not None and code2 is not None:
+        parts.append(packet_index["pairs"].get(code1 * n_macs + code2))
+        parts.append(packet_index["pairs"].get(code2 * n_macs + code1))
+    if label == "air_purifier" and code1 is not None:
+        parts.append(packet_index["dst"].get(code1))
+
+    parts = [p for p in parts if p is not None]
+    if not parts:
+        return np.empty(0, dtype=np.intp)
+    return np.unique(np.concatenate(parts))
+
+
+def extract_features_for_mac_pair(packets, mac1, mac2, label, window_size=1.0,
+                                  packet_index=None):
+    if packet_index is None:
+        packet_index = build_packet_index(packets)
+    keep = select_device_packets(packet_index, mac1, mac2, label)
 
-        # retry flag
-        retry_flag = 1 if dot11.FCfield & 0x8 else 0
+    # No packets → return empty
+    if len(keep) == 0:
+        return pd.DataFrame()
 
-        # Inter-arrival time (still computed)
-        if last_pkt_time is not None:
-            _ = float(pkt.time) - last_pkt_time
-        last_pkt_time = float(pkt.time)
+    times = packets["time"][keep]
+    lens = packets["frame_len"][keep]
 
-        pkt_list.append({
-            "time": float(pkt.time) - t0,
-            "frame_len": frame_len,
-            "ref": ref,
-            "ref1": ref1,
-            "ref2": ref2,
-            "src_mac": src,
-            "dst_mac": dst,
-            "retry": retry_flag
-        })
+    # ref rule
+    ref = np.isin(lens, REF_LENS)
 
-    # No packets → return empty
-    if not pkt_list:
-        return pd.DataFrame()
+    # ref1 rule: the last PATTERN_LEN frame lengths match PATTERN
+    ref1 = match_pattern(lens)
 
-    pkt_list.sort(key=lambda x: x["time"])
-    times = np.array([p["time"] for p in pkt_list])
-    features = []
+    # ref2 rule
+    ref2 = np.isin(lens, REF2_LENS)
 
-    j = 0
-    for i in range(len(times)):
-        while j < len(times) and times[j] - times[i] <= window_size:
-            j += 1
+    # Patterns are matched in capture order, windows are built in time order
+    order = np.argsort(times, kind="stable")
+    times, ref, ref1, ref2 = times[order], ref[order], ref1[order], ref2[order]
 
-        end_time = times[i] + window_size
-        mask = (times >= times[i]) & (times <= end_time)
-        window_pkts = [pkt_list[k] for k in np.where(mask)[0]]
+    # Window i covers [times[i], times[i] + window_size]
+    end_times = times + window_size
+    starts = np.searchsorted(times, times, side="left")
+    ends = np.searchsorted(times, end_times, side="right")
 
-        if not window_pkts:
-            continue
+    # 1-byte flags and 4-byte prefix counts keep the scans cache friendly
+    cum = np.zeros(len(times) + 1, dtype=np.uint32)
 
-        ref = 1 if any(p["ref"] == 1 for p in window_pkts) else 0
-        ref1 = 1 if any(p["ref1"] == 1 for p in window_pkts) else 0
-        ref2 = 1 if any(p["ref2"] == 1 for p in window_pkts) else 0
-
-        features.append({
-            "label": label,
-            "window_start": times[i],
-            "window_end": end_time,
-            "ref": ref,
-            "ref1": ref1,
-            "ref2": ref2
-        })
+    def window_any(flags):
+        np.cumsum(flags, dtype=np.uint32, out=cum[1:])
+        return (cum[ends] > cum[starts]).astype(np.uint8)
 
-    return pd.DataFrame(features)
+    # Columns are freshly built arrays, so let pandas wrap them without copying
+    return pd.DataFrame({
+        "label": np.full(len(times), label, dtype=object),
+        "window_start": times,
+        "window_end": end_times,
+        "ref": window_any(ref),
+        "ref1": window_any(ref1),
+        "ref2": window_any(ref2)
+    }, copy=False)
 
 
-# Classification Rules
+# Device Config
 
-def classify_device(device_name, row):
-    if device_name in ["plug", "wall_plug", "tabel_lamp", "switch",
-                       "motion_sensor", "door_sensor"]:
-        return "triggering" if row.get("ref") == 1 else "not_triggering"
+@functools.lru_cache(maxsize=8)
+def _read_device_configs(path, mtime_ns):
+    with open(path, "r") as f:
+        return json.load(f)
 
-    elif device_name == "air_purifier":
-        return "triggering" if row.get("ref1") == 1 else "not_triggering"
 
-    elif device_name in ["power_strip"]:
-        return "triggering" if row.get("ref2") == 1 else "not_triggering"
-    else:
-        return "unknown_device"
+def load_device_configs(config_json):
+    """Parsed device config (read-only), re-read only when the file changes."""
+    return _read_device_configs(os.path.abspath(config_json),
+                                os.stat(config_json).st_mtime_ns)
 
 
 
 # Main Processing
 
-def process_pcap_auto(pcap_file, config_json, window_size=1.0, summary_window=0.5):
+def process_pcap_auto(pcap_file, config_json, window_size=1.0, summary_window=0.5,
+                      cache_dir=CACHE_DIR, output_json=None):
     try:
-        packets = rdpcap(pcap_file)
+        packets = load_packet_table_cached(pcap_file, cache_dir)
     except Exception:
         return None
 
     # Load JSON config
-    with open(config_json, "r") as f:
-        device_configs = json.load(f)
+    device_configs = load_device_configs(config_json)
 
-    all_results = []
+    packet_index = build_packet_index(packets)
 
-    for device in device_configs:
+    def process_device(device):
         name = device["device_name"]
-        mac1 = device["mac1"]
-        mac2 = device["mac2"]
-        label = device["label"]
-
-        df = extract_features_for_mac_pair(packets, mac1, mac2, label, window_size)
+        df = extract_features_for_mac_pair(packets, device["mac1"], device["mac2"],
+                                           device["label"], window_size, packet_index)
         if df.empty:
-            continue
+            return None
 
         df["device"] = name
-        df["predicted"] = df.apply(lambda r: classify_device(name, r), axis=1)
-        all_results.append(df)
+        df["predicted"] = classify_windows(name, df)
+        return df
+
+    all_results = [df for df in map_devices(process_device, device_configs)
+                   if df is not None]
 
     if not all_results:
         return None
 
-    final_df = pd.concat(all_results).sort_values("window_start").reset_index(drop=True)
+    # Each device frame is already time-sorted: a stable merge over the
+    # concatenated runs replaces the full quicksort + reset_index copy
+    final_df = pd.concat(all_results, ignore_index=True)
+    order = np.argsort(final_df["window_start"].to_numpy(), kind="stable")
+    final_df = final_df.take(order)
+
+    # One bincount over (label, bucket) for every label at once; labels come
+    # back sorted like groupby("label"), first_row is each label's earliest row
+    labels, first_row, codes = np.unique(final_df["label"].to_numpy(dtype=str),
+                                         return_index=True, return_inverse=True)
+    edges, counts = count_triggers_per_bucket(
+        codes,
+        final_df["window_start"].to_numpy(),
+        final_df["window_end"].to_numpy(),
+        final_df["predicted"].to_numpy() == "triggering",
+        len(labels),
+        summary_window,
+    )
+    devices = final_df["device"].to_numpy()
 
     trigger_sequence = []
 
-    for label, device_df in final_df.groupby("label"):
-        max_time = device_df["window_end"].max()
-        current_start = 0.0
-
-        best_window = None  # For air_purifier
-        first_window_found = False  # For other devices
-
-        while current_start < max_time:
-            current_end = current_start + summary_window
-            mask = (device_df["window_start"] >= current_start) & \
-                   (device_df["window_start"] < current_end)
-            window_df = device_df[mask]
-
-            trigger_count = sum(window_df["predicted"] == "triggering")
-
-            if trigger_count > 0:
-                # air_purifier → take window with max triggers
-                if label == "air_purifier":
-                    if best_window is None or trigger_count > best_window["trigger_count"]:
-                        best_window = {
-                            "label": label,
-                            "device": device_df["device"].iloc[0],
-                            "start": round(float(current_start), 3),
-                            "end": round(float(current_end), 3),
-                            "trigger_count": int(trigger_count)
-                        }
-                else:
-                    # other devices → take first triggering window only
-                    if not first_window_found:
-                        trigger_sequence.append({
-                            "label": label,
-                            "device": device_df["device"].iloc[0],
-                            "start": round(float(current_start), 3),
-                            "end": round(float(current_end), 3),
-                            "trigger_count": int(trigger_count)
-                        })
-                        first_window_found = True
-
-            current_start += summary_window
-
-        if label == "air_purifier" and best_window is not None:
-            trigger_sequence.append(best_window)
+    for code, label in enumerate(labels):
+        label_counts = counts[code]
+        if not label_counts.any():
+            continue
+
+        if label == "air_purifier":
+            # air_purifier → take window with max triggers
+            k = int(np.argmax(label_counts))
+        else:
+            # other devices → take first triggering window only
+            k = int(np.argmax(label_counts > 0))
+
+        trigger_sequence.append({
+            "label": str(label),
+            "device": devices[first_row[code]],
+            "start": round(float(edges[k]), 3),
+            "end": round(float(edges[k + 1]), 3),
+            "trigger_count": int(label_counts[k])
+        })
 
     # Sort by start time
     trigger_sequence = sorted(trigger_sequence, key=lambda x: x["start"])
@@ -209,9 +462,10 @@ def process_pcap_auto(pcap_file, config_json, window_size=1.0, summary_window=0.
     for idx, item in enumerate(trigger_sequence, start=1):
         item["order"] = idx
 
-    # Save JSON output
-    with open("trigger_sequence.json", "w") as f:
-        json.dump(trigger_sequence, f, indent=4)
+    # Save JSON output (only when asked to)
+    if output_json:
+        with open(output_json, "w") as f:
+            json.dump(trigger_sequence, f, indent=4)
 
     return trigger_sequence
 
@@ -222,4 +476,5 @@ def process_pcap_auto(pcap_file, config_json, window_size=1.0, summary_window=0.
 if __name__ == "__main__":
     config_json = "device_config.json"
     pcap_file = "capture-01.cap"
-    process_pcap_auto(pcap_file, config_json, summary_window=10)
+    process_pcap_auto(pcap_file, config_json, summary_window=10,
+                      output_json="trigger_sequence.json")
@@ -0,0 +1,16 @@
+# gunicorn.conf.py — production entry point (Linux):
+#   gunicorn -c gunicorn.conf.py server:app
+# gthread runs each request (including every open SSE log stream) on a real OS
+# thread. An event-loop worker such as gevent would monkey-patch threading, so
+# the ThreadPoolExecutors in the analysis endpoints would become greenlets and
+# their CPU-bound pcap parsing would freeze every log stream until it finished.
+
+bind = "0.0.0.0:5000"
+
+# Capture state (process_active, log_queue, the shared SSH connection) lives in
+# module globals, so everything must run in a single worker process
+workers = 1
+worker_class = "gthread"
+
+# Each open log stream holds one of these threads for as long as the tab is open
+threads = 32
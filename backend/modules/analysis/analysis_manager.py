@@ -1,7 +1,9 @@
 # modules/analysis/analysis_manager.py
 from flask import Blueprint, jsonify, request
-from scapy.all import rdpcap, Dot11
+from scapy.all import RawPcapReader, Dot11, conf
 import os
+from collections import Counter
+import numpy as np
 
 analysis_bp = Blueprint("analysis", __name__, url_prefix="/api/analysis")
 
@@ -15,9 +17,61 @@ def _normalize_mac(mac):
     return mac.replace(":", "").replace("-", "").lower()
 
 
+BROADCAST_MACS = frozenset({"ff:ff:ff:ff:ff:ff", "ffffffffffff"})
+HEX_DIGITS = frozenset("0123456789abcdef")
+
+# Byte offsets of addr1..addr4 inside the 802.11 MAC header. Scapy only reports
+# an address field when it is present, and present fields always sit here.
+DOT11_ADDR_OFFSETS = (4, 10, 16, 24)
+LINKTYPE_IEEE802_11 = 105
+LINKTYPE_RADIOTAP = 127
+
+
+def _canonical_mac(mac):
+    """Return MAC in Scapy's lowercase colon form (aa:bb:cc:dd:ee:ff), or None."""
+    bare = _normalize_mac(mac)
+    if not bare or len(bare) != 12 or not HEX_DIGITS.issuperset(bare):
+        return None
+    return ":".join(bare[i:i + 2] for i in range(0, 12, 2))
+
+
+def _may_involve_mac(data, linktype, mac_bytes):
+    """
+    Cheap test on raw frame bytes: False only if no Dot11 address can equal
+    mac_bytes, so the frame can be skipped without Scapy dissection.
+    """
+    if mac_bytes not in data:
+        return False
+    if linktype == LINKTYPE_IEEE802_11:
+        base = 0
+    elif linktype == LINKTYPE_RADIOTAP and len(data) >= 4:
+        base = data[2] | (data[3] << 8)
+    else:
+        return True  # unknown framing, let Scapy decide
+    return any(data[base + off:base + off + 6] == mac_bytes for off in DOT11_ADDR_OFFSETS)
+
+
 def _is_broadcast(mac):
     """Return True if MAC is broadcast (ff:ff:ff:ff:ff:ff)."""
-    return mac.lower() in {"ff:ff:ff:ff:ff:ff", "ffffffffffff"}
+    return mac.lower() in BROADCAST_MACS
+
+
+def _top_n(counts_by_key, n=10):
+    """
+    Return the n largest (key, count) pairs, ties in insertion order — same as
+    sorted(items, key=count, reverse=True)[:n], but partitioned in O(N).
+    """
+    if len(counts_by_key) <= n:
+        return sorted(counts_by_key.items(), key=lambda x: x[1], reverse=True)
+
+    keys = list(counts_by_key)
+    counts = np.fromiter(counts_by_key.values(), dtype=np.int64, count=len(keys))
+
+    # Everything tied with the n-th largest count is a candidate; rank only those
+    kth = np.partition(counts, len(counts) - n)[len(counts) - n]
+    cand = np.flatnonzero(counts >= kth)
+    cand = cand[np.lexsort((cand, -counts[cand]))][:n]
+    return [(keys[i], int(counts[i])) for i in cand]
 
 
 @analysis_bp.route("/analyze", methods=["POST"])
@@ -50,72 +104,82 @@ def analyze_capture():
         if not os.path.exists(file_path):
             return jsonify({"ok": False, "error": f"File not found: {file_path}"}), 404
 
-        # --- Read Packets ---
-        all_packets = rdpcap(file_path)
-        total_before_filter = len(all_packets)
-        bssid_norm = _normalize_mac(bssid)
+        # Scapy reports addresses as lowercase colon strings, so normalize the
+        # BSSID once and compare addresses against it directly.
+        bssid_mac = _canonical_mac(bssid)
+        targets = {bssid_mac} if bssid_mac else set()
+        bssid_bytes = bytes.fromhex(bssid_mac.replace(":", "")) if bssid_mac else None
 
-        print(f"[DEBUG] Loaded {total_before_filter} packets")
         print(f"[DEBUG] Filtering by wlan.addr == {bssid}")
 
-        # --- Filter Packets (wlan.addr == bssid) ---
-        filtered_packets = []
-        for pkt in all_packets:
-            if pkt.haslayer(Dot11):
+        # --- Initialize Stats ---
+        total_before_filter = 0
+        total_after_filter = 0
+        packet_types = {"Management": 0, "Control": 0, "Data": 0}
+        flows = Counter()
+        host_counts = Counter()
+
+        # --- Stream Packets (one pass: filter + analyze) ---
+        with RawPcapReader(file_path) as reader:
+            for data, meta in reader:
+                total_before_filter += 1
+
+                # --- Raw prefilter: only dissect frames that can carry the BSSID ---
+                linktype = getattr(meta, "linktype", None) or reader.linktype
+                if bssid_bytes is None or not _may_involve_mac(data, linktype, bssid_bytes):
+                    continue
+                try:
+                    pkt = conf.l2types.num2layer.get(linktype, conf.raw_layer)(data)
+                except Exception:
+                    continue
+                if not pkt.haslayer(Dot11):
+                    continue
+
+                # --- Filter Packets (wlan.addr == bssid) ---
                 dot11 = pkt[Dot11]
-                for addr in [dot11.addr1, dot11.addr2, dot11.addr3, getattr(dot11, "addr4", None)]:
-                    if addr and _normalize_mac(addr) == bssid_norm:
-                        filtered_packets.append(pkt)
-                        break  # Include packet once only
-        packets = filtered_packets
-        total_after_filter = len(packets)
+                src = dot11.addr2
+                dst = dot11.addr1
+                if not (
+                    dst in targets
+                    or src in targets
+                    or dot11.addr3 in targets
+                    or getattr(dot11, "addr4", None) in targets
+                ):
+                    continue
+                total_after_filter += 1
+
+                # --- Analyze MAC Layer ---
+                frame_type = getattr(dot11, "type", None)
+
+                if frame_type == 0:
+                    packet_types["Management"] += 1
+                elif frame_type == 1:
+                    packet_types["Control"] += 1
+                elif frame_type == 2:
+                    packet_types["Data"] += 1
+
+                if not src or not dst:
+                    continue
+                if src in BROADCAST_MACS or dst in BROADCAST_MACS:
+                    continue
+
+                # Only include flows where one side is the BSSID
+                src_is_bssid = src in targets
+                if not (src_is_bssid or dst in targets):
+                    continue
+                if src == dst:
+                    continue
+
+                # Record directional flow
+                flows[(src, dst)] += 1
+
+                # Track communication peers (non-bssid, never broadcast here)
+                peer = dst if src_is_bssid else src
+                host_counts[peer] += 1
 
+        print(f"[DEBUG] Loaded {total_before_filter} packets")
         print(f"[DEBUG] After filter: {total_after_filter} packets remain")
 
-        # --- Initialize Stats ---
-        packet_types = {"Management": 0, "Control": 0, "Data": 0}
-        flows = {}
-        host_counts = {}
-
-        # --- Analyze MAC Layer ---
-        for pkt in packets:
-            if not pkt.haslayer(Dot11):
-                continue
-
-            dot11 = pkt[Dot11]
-            frame_type = getattr(dot11, "type", None)
-
-            if frame_type == 0:
-                packet_types["Management"] += 1
-            elif frame_type == 1:
-                packet_types["Control"] += 1
-            elif frame_type == 2:
-                packet_types["Data"] += 1
-
-            src = dot11.addr2
-            dst = dot11.addr1
-            if not src or not dst:
-                continue
-            if _is_broadcast(src) or _is_broadcast(dst):
-                continue
-
-            src_norm = _normalize_mac(src)
-            dst_norm = _normalize_mac(dst)
-
-            # Only include flows where one side is the BSSID
-            if not (src_norm == bssid_norm or dst_norm == bssid_norm):
-                continue
-            if src_norm == dst_norm:
-                continue
-
-            # Record directional flow
-            flows[(src, dst)] = flows.get((src, dst), 0) + 1
-
-            # Track communication peers (non-bssid)
-            peer = dst if src_norm == bssid_norm else src
-            if not _is_broadcast(peer):
-                host_counts[peer] = host_counts.get(peer, 0) + 1
-
         # --- Frame Type Percentages ---
         total_classified = sum(packet_types.values()) or 1
         packet_type_percent = {
@@ -124,19 +188,17 @@ def analyze_capture():
         }
 
         # --- Prepare Output ---
-        top_flows = sorted(flows.items(), key=lambda x: x[1], reverse=True)[:10]
+        top_flows = _top_n(flows, 10)
         flow_data = [
             {"src": s, "dst": d, "packets": c}
             for (s, d), c in top_flows
         ]
 
         # Top 10 communicating hosts (exclude BSSID)
-        top_hosts = sorted(
-            [(mac, count) for mac, count in host_counts.items() if _normalize_mac(mac) != bssid_norm],
-            key=lambda x: x[1],
-            reverse=True,
+        top_hosts = _top_n(
+            {mac: count for mac, count in host_counts.items() if mac not in targets}, 10
         )
-        communicated_hosts = [mac for mac, _ in top_hosts[:10]]
+        communicated_hosts = [mac for mac, _ in top_hosts]
 
         # --- Response ---
         return jsonify({
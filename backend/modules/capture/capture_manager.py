@@ -3,15 +3,22 @@
 from flask import Blueprint, jsonify, Response, request
 from datetime import datetime
 import threading
-import paramiko
+from concurrent.futures import ThreadPoolExecutor
 import time
 import json
+import re
 import queue
 
-from modules.capture.utils import strip_ansi_codes
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:  # optional speedup, stdlib json works the same here
+    json_loads = json.loads
+
+from modules.capture.utils import strip_ansi_codes, read_channel_lines
 from modules.capture.config import SCRIPT_PATH
-from modules.capture.log_queue import log_queue
-from modules.config import PI_HOST, PI_USER, PI_PASS
+from modules.capture.log_queue import log_queue, log_event
+from modules import ssh_pool
 from modules.transfer.transfer_manager import download_file_from_pi, TransferError
 
 
@@ -27,24 +34,65 @@ def init_capture_globals(globals_dict):
     process_active = globals_dict["process_active"]
     client = globals_dict["client"]
     lock = globals_dict["lock"]
-    packet_count = globals_dict["packet_count"]
+    packet_count = PacketCounter(globals_dict["packet_count"])
     capture_session = globals_dict["capture_session"]
 
 
+# ============================================================
+# Helper — Packet Counter
+# ============================================================
+class PacketCounter:
+    """Packet-line count shared by the capture thread and the HTTP routes."""
+
+    __slots__ = ("_n", "_lock")
+
+    def __init__(self, n=0):
+        self._n = n
+        self._lock = threading.Lock()
+
+    def add(self, k=1):
+        with self._lock:
+            self._n += k
+
+    def reset(self):
+        with self._lock:
+            self._n = 0
+
+    def get(self):
+        return self._n
+
+
 # ============================================================
 # Helper — Clear Log Queue
 # ============================================================
 def clear_log_queue():
-    while not log_queue.empty():
-        try:
-            log_queue.get_nowait()
-        except queue.Empty:
-            break
+    log_queue.clear()
+
+
+# ============================================================
+# Helper — Batched Log Puts
+# ============================================================
+LOG_BATCH_LINES = 32
+
+
+def flush_log_batch(batch):
+    """Queue buffered lines as one newline-joined message (split again by the SSE stream)."""
+    if batch:
+        log_queue.put("\n".join(batch))
+        batch.clear()
+
+
+def batch_is_due(batch, channel):
+    """Flush once the batch is full or the remote has nothing more pending right now."""
+    return len(batch) >= LOG_BATCH_LINES or not channel.recv_ready()
 
 
 # ============================================================
 # LIST ACCESS POINTS
 # ============================================================
+AP_JSON_MARKER = "###JSON###"
+
+
 @capture_bp.route("/list-aps", methods=["POST"])
 def list_aps():
     clear_log_queue()
@@ -56,36 +104,38 @@ def list_aps():
     log_queue.put("[/] Initializing Wifi Sniffing on Raspberry Pi ...")
 
     try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(PI_HOST, username=PI_USER, password=PI_PASS)
-
         cmd = f"sudo python3 {SCRIPT_PATH}"
         log_queue.put(f"[$] Activating Passive WiFi Sniffer - By Team Shadow-Scan <-")
 
-        stdin, stdout, stderr = ssh.exec_command(cmd, get_pty=True)
+        chan = ssh_pool.run(cmd, pty=True)
 
         aps_json = "[]"
         json_detected = False
+        batch = []
+
+        for lines in read_channel_lines(chan):
+            for clean in lines:
+                if not clean:
+                    continue
 
-        for raw_line in iter(stdout.readline, ""):
-            clean = strip_ansi_codes(raw_line.strip())
-            if not clean:
-                continue
+                # The scanner prints its AP list once, as a single marker line
+                if not json_detected and clean.startswith(AP_JSON_MARKER):
+                    aps_json = clean[len(AP_JSON_MARKER):].strip()
+                    json_detected = True
+                    continue
 
-            if clean.startswith("###JSON###"):
-                aps_json = clean.replace("###JSON###", "").strip()
-                json_detected = True
-                continue
+                batch.append(clean)
 
-            log_queue.put(clean)
+            if batch_is_due(batch, chan):
+                flush_log_batch(batch)
 
-        ssh.close()
+        flush_log_batch(batch)
+        chan.close()
 
         aps = []
         if json_detected:
             try:
-                aps = json.loads(aps_json)
+                aps = json_loads(aps_json)
             except Exception as parse_err:
                 log_queue.put(f"[!] Failed to parse JSON: {parse_err}")
         else:
@@ -103,14 +153,21 @@ def list_aps():
 
     finally:
         process_active = False
+        log_event.set()  # let the SSE stream notice the scan ended
 
 
 # ============================================================
 # START CAPTURE
 # ============================================================
+CAPTURE_POLL_INTERVAL = 0.1  # seconds
+
+# Lines mentioning a packet (any case) count towards packetCount
+PACKET_LINE_RE = re.compile("packet", re.IGNORECASE)
+
+
 @capture_bp.route("/start", methods=["POST"])
 def start_capture():
-    global client, process_active, capture_session, packet_count
+    global client, process_active, capture_session
 
     data = request.get_json() or {}
     iface = data.get("interface", "wlan1")
@@ -125,41 +182,56 @@ def start_capture():
             return jsonify({"ok": False, "error": "Capture already running"}), 400
         process_active = True
         capture_session = f"cap-{int(time.time())}"
-        packet_count = 0
-        while not log_queue.empty():
-            log_queue.get()
+        packet_count.reset()
+        clear_log_queue()
 
     def run_capture():
-        global client, process_active, packet_count
+        global client, process_active
+        batch = []
+        capture_ssh = None
         try:
-            client = paramiko.SSHClient()
-            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            client.connect(PI_HOST, username=PI_USER, password=PI_PASS)
-
             cmd = f"sudo python3 {SCRIPT_PATH} --bssid {bssid} --channel {channel}"
 
-            stdin, stdout, stderr = client.exec_command(cmd, get_pty=True)
+            # Runs on a connection of its own, so resetting the shared one
+            # (used by /stop's pkill and the SFTP download) cannot cut it off;
+            # client holds the capture channel
+            capture_ssh, client = ssh_pool.run_dedicated(cmd, pty=True)
 
-            for line in iter(stdout.readline, ""):
+            # Wake every CAPTURE_POLL_INTERVAL even when the Pi is quiet, so a
+            # stop request ends the loop without waiting for another line
+            for lines in read_channel_lines(client, poll_interval=CAPTURE_POLL_INTERVAL):
                 if not process_active:
                     break
-                clean_line = strip_ansi_codes(line.strip())
-                if clean_line:
-                    log_queue.put(clean_line)
-                    if "packet" in clean_line.lower():
-                        packet_count += 1
+                found = 0
+                for clean_line in lines:
+                    if clean_line:
+                        batch.append(clean_line)
+                        if PACKET_LINE_RE.search(clean_line):
+                            found += 1
+                if found:
+                    packet_count.add(found)
+                if batch_is_due(batch, client):
+                    flush_log_batch(batch)
 
         except Exception as e:
             log_queue.put(f"[✗] Capture error: {e}")
         finally:
-            if client:
-                try:
-                    client.close()
-                except Exception:
-                    pass
-            with lock:
-                process_active = False
+            flush_log_batch(batch)
+            for conn in (client, capture_ssh):
+                if conn:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            # Queued before process_active is cleared, so a stream that sees
+            # the run over has this line in the queue already
             log_queue.put("[-] Capture process stopped.")
+            with lock:
+                # During /stop the route still has logs to send and clears
+                # process_active itself once the download is done
+                if not stop_in_progress.is_set():
+                    process_active = False
+            log_event.set()
 
     thread = threading.Thread(target=run_capture, daemon=True)
     thread.start()
@@ -174,73 +246,169 @@ def start_capture():
 # ============================================================
 # STOP CAPTURE
 # ============================================================
+STOP_WAIT_TIMEOUT = 3  # seconds
+STOP_FORCE_AFTER = 1  # seconds before SIGINT is escalated to SIGKILL
+STOP_POLL_INTERVAL = 0.05
+
+# Set while /stop runs, so the exiting capture thread leaves process_active to it
+stop_in_progress = threading.Event()
+
+# One pkill covers both processes. The [w]/[a] brackets keep the pattern from
+# matching the remote shell running pkill itself, whose command line contains it.
+CAPTURE_PROCESS_PATTERN = r"[w]ifi_sniff\.py|[a]irodump-ng"
+STOP_CMD = f"sudo pkill -INT -f '{CAPTURE_PROCESS_PATTERN}' || true"
+FORCE_STOP_CMD = f"sudo pkill -KILL -f '{CAPTURE_PROCESS_PATTERN}' || true"
+
+
+def _kill_and_wait():
+    """
+    Interrupt the capture on the Pi (SIGINT lets airodump-ng close the .cap
+    cleanly) and give it up to STOP_WAIT_TIMEOUT to finish, sending SIGKILL if
+    it is still running after STOP_FORCE_AFTER. Done once pkill has returned
+    and the capture command's channel has exited. The pkill channels are
+    closed before returning, so none count against the Pi's MaxSessions.
+    """
+    kill = ssh_pool.run(STOP_CMD)
+    channels = [kill]
+    started = time.monotonic()
+    forced = False
+
+    try:
+        while True:
+            capture = client
+            if kill.exit_status_ready() and (capture is None or capture.exit_status_ready()):
+                break
+            elapsed = time.monotonic() - started
+            if elapsed >= STOP_WAIT_TIMEOUT:
+                break
+            if not forced and elapsed >= STOP_FORCE_AFTER:
+                kill = ssh_pool.run(FORCE_STOP_CMD)
+                channels.append(kill)
+                forced = True
+            time.sleep(STOP_POLL_INTERVAL)
+    finally:
+        for chan in channels:
+            chan.close()
+
+
 @capture_bp.route("/stop/<session_id>", methods=["POST"])
 def stop_capture(session_id):
-    global client, process_active, packet_count
+    global client, process_active
 
     with lock:
         if not process_active:
             return jsonify({"ok": False, "error": "No active capture"}), 400
         process_active = True  # keep active until done
+        stop_in_progress.set()
 
     try:
         log_queue.put("🛑 Sending stop command to Raspberry Pi...")
 
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(PI_HOST, username=PI_USER, password=PI_PASS)
-        ssh.exec_command("sudo pkill -f 'wifi_sniff.py' || true; sudo pkill -f 'airodump-ng' || true")
-        ssh.close()
+        # The download connects and opens SFTP while the Pi is still shutting
+        # down, and only fetches the file once capture_done is set
+        capture_done = threading.Event()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            download = executor.submit(download_file_from_pi, wait_for=capture_done)
+            try:
+                _kill_and_wait()
+            except Exception as e:
+                log_queue.put(f"[!] Stop command failed: {e}")
+            finally:
+                capture_done.set()
 
-        time.sleep(3)
         local_path = None
 
         try:
-            local_path = download_file_from_pi()
+            local_path = download.result()
         except TransferError as e:
             log_queue.put(f"[!] File transfer failed: {e}")
         except Exception as e:
             log_queue.put(f"[✗] Unexpected transfer error: {e}")
 
-        time.sleep(0.5)
         with lock:
             process_active = False
+            stop_in_progress.clear()
+        log_event.set()
 
         return jsonify({
             "ok": True,
             "fileUrl": local_path or None,
-            "meta": {"packetCount": packet_count, "duration": 0}
+            "meta": {"packetCount": packet_count.get(), "duration": 0}
         }), 200
 
     except Exception as e:
+        log_queue.put(f"[✗] Stop error: {e}")
         with lock:
             process_active = False
-        log_queue.put(f"[✗] Stop error: {e}")
+            stop_in_progress.clear()
+        log_event.set()
         return jsonify({"ok": False, "error": str(e)}), 500
 
 
 # ============================================================
 # STREAM LOGS (SSE)
 # ============================================================
+LOG_IDLE_TIMEOUT = 1  # seconds a stream opened before any run waits for one to start
+SSE_HEARTBEAT_INTERVAL = 15  # idle wait while a process runs; a comment frame keeps proxies open
+SSE_HEARTBEAT_FRAME = b": keepalive\n\n"
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+    "Access-Control-Allow-Origin": "*",
+}
+SSE_BATCH_MESSAGES = 64  # queued messages written per SSE chunk
+
+
+def sse_frame(obj):
+    """
+    Serialize obj as one UTF-8 encoded SSE data frame; json.dumps escapes
+    quotes, backslashes and newlines.
+    """
+    return f"data: {json.dumps(obj, ensure_ascii=False, separators=(',', ':'))}\n\n".encode()
+
+
+SSE_DONE_FRAME = sse_frame({"type": "info", "message": "[✓] Process finished"})
+
+
 @capture_bp.route("/logs", methods=["GET"])
 def stream_logs():
     def generate():
         while True:
-            try:
-                line = log_queue.get(timeout=1)
-                clean = strip_ansi_codes(line).replace('"', '\\"')
-                yield f'data: {{"type":"log","message":"{clean}"}}\n\n'
-            except queue.Empty:
-                if not process_active and log_queue.empty():
-                    yield f'data: {{"type":"info","message":"[✓] Process finished"}}\n\n'
+            # Sleep until a producer queues something or a run ends (both set
+            # log_event). While a process runs the only timed wakeup is the
+            # heartbeat.
+            running = process_active
+            woken = log_event.wait(timeout=SSE_HEARTBEAT_INTERVAL if running else LOG_IDLE_TIMEOUT)
+            log_event.clear()
+
+            # Everything drained in one pass goes out as a single chunk: one
+            # WSGI write / TCP send instead of one per log line
+            while True:
+                frames = []
+                for _ in range(SSE_BATCH_MESSAGES):
+                    try:
+                        payload = log_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    # No escape sequence can span a newline, so one strip over
+                    # the whole batched payload equals stripping each line
+                    for line in strip_ansi_codes(payload).split("\n"):
+                        frames.append(sse_frame({"type": "log", "message": line}))
+                if not frames:
                     break
-                continue
+                yield b"".join(frames)
+
+            # Finish as soon as the run is over and everything was sent
+            if not process_active and log_queue.empty():
+                yield SSE_DONE_FRAME
+                break
+            if not woken and running:
+                yield SSE_HEARTBEAT_FRAME
 
-    response = Response(generate(), mimetype="text/event-stream")
-    response.headers["Cache-Control"] = "no-cache"
-    response.headers["X-Accel-Buffering"] = "no"
-    response.headers["Access-Control-Allow-Origin"] = "*"
-    return response
+    # Frames are already bytes, so Werkzeug can hand them to the server as is
+    return Response(generate(), mimetype="text/event-stream", headers=SSE_HEADERS,
+                    direct_passthrough=True)
 
 
 # ============================================================
@@ -248,24 +416,20 @@ def stream_logs():
 # ============================================================
 @capture_bp.route("/reset", methods=["POST"])
 def reset_capture():
-    global process_active, packet_count, client
+    global process_active, client
 
     try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(PI_HOST, username=PI_USER, password=PI_PASS, timeout=10)
-        ssh.exec_command("sudo pkill -f 'wifi_sniff.py' || true; sudo pkill -f 'airodump-ng' || true")
-        ssh.close()
+        # Same interrupt / escalate / wait as /stop, so a wedged airodump-ng
+        # does not survive a reset
+        _kill_and_wait()
 
         process_active = False
-        packet_count = 0
+        stop_in_progress.clear()
+        packet_count.reset()
         client = None
+        log_event.set()
 
-        while not log_queue.empty():
-            try:
-                log_queue.get_nowait()
-            except:
-                break
+        clear_log_queue()
 
         return jsonify({"ok": True, "message": "Session fully reset"}), 200
 
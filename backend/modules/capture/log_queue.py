@@ -1,3 +1,44 @@
 import queue
+import threading
+from collections import deque
 
-log_queue = queue.Queue()
+# Most messages a stream with no SSE consumer can back up; past this the
+# oldest are dropped, so memory stays bounded during long unattended captures
+LOG_QUEUE_MAXLEN = 4096
+
+# Set whenever a message is queued, so the SSE stream sleeps until there is
+# something to send instead of polling the queue
+log_event = threading.Event()
+
+
+class LogQueue:
+    """
+    FIFO of log messages for the SSE stream. deque append/popleft are atomic,
+    so producers and the consumer never take a lock, and clear() drops any
+    backlog in one step. Bounded: a put on a full queue discards the oldest
+    message instead of blocking. Raises log_event after every put.
+    """
+
+    def __init__(self, maxlen=LOG_QUEUE_MAXLEN):
+        self._items = deque(maxlen=maxlen)
+
+    def put(self, item):
+        self._items.append(item)
+        log_event.set()
+
+    put_nowait = put
+
+    def get_nowait(self):
+        try:
+            return self._items.popleft()
+        except IndexError:
+            raise queue.Empty from None
+
+    def empty(self):
+        return not self._items
+
+    def clear(self):
+        self._items.clear()
+
+
+log_queue = LogQueue()
@@ -1,6 +1,51 @@
 import re
+import socket
+
+ANSI_ESCAPE_RE = re.compile(r"\x1B[@-_][0-?]*[ -/]*[@-~]", re.ASCII)
+ANSI_ESCAPE_BYTES_RE = re.compile(rb"\x1B[@-_][0-?]*[ -/]*[@-~]")
+
+# Take everything Paramiko has buffered for the channel in one recv() (its
+# window is 2 MiB), rather than 4 KiB at a time
+CHANNEL_READ_SIZE = 64 * 1024
+
 
 def strip_ansi_codes(text):
     """Remove ANSI color codes from log lines."""
-    ansi_escape = re.compile(r"(?:\x1B[@-_][0-?]*[ -/]*[@-~])")
-    return ansi_escape.sub("", text)
+    # Every escape starts with ESC; most lines have none and skip the regex
+    if "\x1b" not in text:
+        return text
+    return ANSI_ESCAPE_RE.sub("", text)
+
+
+def read_channel_lines(channel, bufsize=CHANNEL_READ_SIZE, poll_interval=None):
+    """
+    Read a Paramiko channel in chunks until the remote closes it, yielding the
+    lines completed by each chunk, stripped and ANSI-free. Escapes are removed
+    on the raw bytes so each line is decoded exactly once.
+
+    With poll_interval set, an empty list is yielded whenever no data arrived
+    for that many seconds, so the caller can check its stop flag.
+    """
+    if poll_interval is not None:
+        channel.settimeout(poll_interval)
+
+    tail = b""
+    while True:
+        try:
+            data = channel.recv(bufsize)
+        except socket.timeout:
+            yield []
+            continue
+        if not data:
+            break
+        *lines, tail = (tail + data).split(b"\n")
+        yield [_clean_line(raw) for raw in lines]
+    if tail:
+        yield [_clean_line(tail)]
+
+
+def _clean_line(raw):
+    raw = raw.strip()
+    if b"\x1b" in raw:
+        raw = ANSI_ESCAPE_BYTES_RE.sub(b"", raw)
+    return raw.decode("utf-8", "replace")
@@ -1,12 +1,20 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
+import functools
 import os
 import time
-from scapy.all import rdpcap, Dot11
-import pandas as pd
+from dataclasses import dataclass
+from scapy.all import RawPcapReader, Dot11, EDecimal, conf as scapy_conf
 import numpy as np
 import math
 import re
 
+from modules.trigger_windows import classify_windows, count_triggers_per_bucket, map_devices
+
+try:
+    import orjson
+except ImportError:  # optional speedup, jsonify() works the same here
+    orjson = None
+
 deviceaction_bp = Blueprint("deviceaction", __name__)
 
 
@@ -14,6 +22,8 @@ deviceaction_bp = Blueprint("deviceaction", __name__)
 # Utility helpers
 # ---------------------------------------------------------------------------
 
+# Called with the same few device / router MACs on every request
+@functools.lru_cache(maxsize=8192)
 def normalize_mac(mac):
     if not mac:
         return None
@@ -24,12 +34,43 @@ def normalize_mac(mac):
     return mac
 
 
+# Packed stand-ins for MACs (see pack_mac): an absent address field, and a
+# configured address that is not a 48-bit MAC. Neither equals a real address.
+NO_MAC = -1
+INVALID_MAC = -2
+
+HEX_DIGITS = frozenset("0123456789abcdef")
+
+# Destination prefixes counted as local discovery traffic: ff:ff:ff (broadcast)
+# and 33:33 (IPv6 multicast), as (shift, value) on the packed address
+MULTICAST_PREFIXES = ((24, 0xFFFFFF), (32, 0x3333))
+
+
+def pack_mac(mac):
+    """Pack a normalized MAC into a 48-bit int, so comparisons are integer compares."""
+    if not mac:
+        return NO_MAC
+    bare = mac.replace(":", "")
+    if len(bare) != 12 or not HEX_DIGITS.issuperset(bare):
+        return INVALID_MAC
+    return int(bare, 16)
+
+
+def unpack_mac(code):
+    """Inverse of pack_mac for real addresses: aa:bb:cc:dd:ee:ff."""
+    bare = f"{code:012x}"
+    return ":".join(bare[i:i + 2] for i in range(0, 12, 2))
+
+
+# Both label helpers see the same handful of device names over and over
+@functools.lru_cache(maxsize=256)
 def normalize_label(name_raw):
     if not name_raw:
         return ""
     return str(name_raw).lower().replace(" ", "_")
 
 
+@functools.lru_cache(maxsize=256)
 def format_device_name_for_output(name_raw):
     if not name_raw:
         return ""
@@ -37,182 +78,310 @@ def format_device_name_for_output(name_raw):
     return " ".join(part.capitalize() for part in s.split())
 
 
+def packet_type_counts(packet_types):
+    """(data, management, control) frame counts from a frontend packet_types dict."""
+    return (
+        packet_types.get("data", {}).get("count", 0),
+        packet_types.get("management", {}).get("count", 0),
+        packet_types.get("control", {}).get("count", 0),
+    )
+
+
 def calculate_prediction_confidence(
     trigger_count: int,
     total_windows: int,
     data_packet_ratio: float,
     total_packets: int
 ) -> float:
-    # how dense the triggers are over all windows
-    if total_windows and total_windows > 0:
-        trigger_density = trigger_count / float(total_windows)
-        trigger_density = max(0.0, min(1.0, trigger_density))
+    # Callers pass plain counts and a ratio, so the arithmetic runs unguarded
+    if total_windows > 0:
+        # how dense the triggers are over all windows
+        trigger_density = min(1.0, trigger_count / total_windows)
+        # packets per window -> reliability
+        pkt_per_window = total_packets / total_windows
     else:
         trigger_density = 1.0 if trigger_count > 0 else 0.0
+        pkt_per_window = float(total_packets)
 
-    # packets per window -> reliability
-    try:
-        if total_windows and total_windows > 0:
-            pkt_per_window = float(total_packets) / float(total_windows)
-        else:
-            pkt_per_window = float(total_packets)
-    except Exception:
-        pkt_per_window = float(total_packets or 0)
-
-    try:
-        packet_strength = 1.0 / (1.0 + math.exp(-0.7 * (pkt_per_window - 1.0)))
-    except Exception:
-        packet_strength = 0.0
-    packet_strength = max(0.0, min(1.0, packet_strength))
+    # logistic, so already within [0, 1]
+    packet_strength = 1.0 / (1.0 + math.exp(-0.7 * (pkt_per_window - 1.0)))
 
     # clamp data ratio
-    try:
-        dr = float(data_packet_ratio) if data_packet_ratio is not None else 0.0
-    except Exception:
-        dr = 0.0
-    dr = max(0.0, min(1.0, dr))
+    dr = max(0.0, min(1.0, data_packet_ratio))
 
     score = 0.6 * trigger_density + 0.25 * packet_strength + 0.15 * dr
-    score = max(0.0, min(1.0, score))
-    return round(score, 3)
+    return round(min(1.0, score), 3)
 
 
 # ---------------------------------------------------------------------------
-# Feature extraction (with 24,10 pattern for ref1)
+# PCAP ingestion
 # ---------------------------------------------------------------------------
 
-def extract_features_for_mac_pair(packets, mac1, mac2, label, window_size=1.0):
-    """
-    Extract ref / ref1 / ref2 features for traffic between mac1 and mac2.
+def _mac_patterns(codes):
+    """Raw 6-byte forms of the real (non-negative) packed MACs in codes."""
+    return tuple(code.to_bytes(6, "big") for code in codes if code >= 0)
 
-    ref1 is raised if we detect the pattern of frame lengths:
-        [24, 10, 24, 10, 24, 10, 24, 10, 24, 10] (24,10 repeated 5 times)
-    """
-    pkt_list = []
-    if not packets:
-        return pd.DataFrame()
 
-    t0 = float(packets[0].time)
+def _record_time(reader, meta):
+    """float(pkt.time) as PcapReader / PcapNgReader would set it, from raw metadata."""
+    if hasattr(meta, "sec"):
+        # Integer ticks / ticks is the correctly rounded sec.usec
+        ticks = 10 ** 9 if reader.nano else 10 ** 6
+        return (meta.sec * ticks + meta.usec) / ticks
+    if meta.tshigh is None:
+        return 0.0
+    return float(EDecimal((meta.tshigh << 32) + meta.tslow) / meta.tsresol)
 
-    PATTERN = [24, 10] * 5
-    PATTERN_LEN = len(PATTERN)
-    length_buffer = []
 
-    for pkt in packets:
-        if not pkt.haslayer(Dot11):
-            continue
+def load_dot11_table(pcap_file, wanted=None, skip=()):
+    """
+    Stream pcap_file once and return its Dot11 packets as parallel NumPy
+    columns, addresses packed (NO_MAC where Scapy reports none), plus each
+    packet's record number in the file. Other packets are dropped here, so
+    no later pass needs a haslayer() check, and each Scapy object is released
+    as soon as its fields are read.
+
+    Like a "wlan host" capture filter, records whose raw bytes contain none of
+    the packed MACs in wanted are skipped before Scapy dissects them (a Dot11
+    address is stored verbatim in the frame, so no match can be lost), as are
+    records containing any MAC in skip.
+    """
+    want_bytes = _mac_patterns(wanted) if wanted is not None else None
+    skip_bytes = _mac_patterns(skip)
 
-        dot11 = pkt[Dot11]
-        src, dst = dot11.addr2, dot11.addr1
+    records, times, frame_lens, types, subtypes = [], [], [], [], []
+    addr1, addr2, addr3 = [], [], []
 
-        # Only keep traffic between device and router
-        if label == "air_purifier":
-            # air purifier special rule: accept packets where dst == mac1 as well
-            if ((src, dst) not in [(mac1, mac2), (mac2, mac1)]) and (dst != mac1):
+    with RawPcapReader(pcap_file) as reader:
+        for record, (data, meta) in enumerate(reader):
+            if want_bytes is not None and not any(m in data for m in want_bytes):
                 continue
-        else:
-            if (src, dst) not in [(mac1, mac2), (mac2, mac1)]:
+            if any(m in data for m in skip_bytes):
+                continue
+            linktype = getattr(meta, "linktype", None) or reader.linktype
+            try:
+                pkt = scapy_conf.l2types.num2layer.get(linktype, scapy_conf.raw_layer)(data)
+            except Exception:
+                continue
+            # One layer walk instead of haslayer() followed by pkt[Dot11]
+            dot11 = pkt.getlayer(Dot11)
+            if dot11 is None:
                 continue
+            records.append(record)
+            times.append(_record_time(reader, meta))
+            frame_lens.append(len(pkt))
+            types.append(dot11.type)
+            subtypes.append(dot11.subtype)
+            # Scapy addresses are already aa:bb:cc:dd:ee:ff, so pack them directly
+            for column, a in ((addr1, dot11.addr1), (addr2, dot11.addr2), (addr3, dot11.addr3)):
+                column.append(int(a.replace(":", ""), 16) if a else NO_MAC)
+
+    return {
+        "record": np.array(records, dtype=np.int64),
+        "time": np.array(times, dtype=np.float64),
+        "frame_len": np.array(frame_lens, dtype=np.int32),
+        "type": np.array(types, dtype=np.int8),
+        "subtype": np.array(subtypes, dtype=np.int8),
+        "addr1": np.array(addr1, dtype=np.int64),
+        "addr2": np.array(addr2, dtype=np.int64),
+        "addr3": np.array(addr3, dtype=np.int64),
+    }
 
-        frame_len = len(pkt)
 
-        # pattern detection buffer
-        length_buffer.append(frame_len)
-        if len(length_buffer) > PATTERN_LEN:
-            length_buffer.pop(0)
+def merge_tables(first, second):
+    """Combine two packet tables of the same capture back into record order."""
+    order = np.argsort(np.concatenate((first["record"], second["record"])), kind="stable")
+    return {name: np.concatenate((col, second[name]))[order] for name, col in first.items()}
 
-        pattern_match = (length_buffer == PATTERN)
-        ref1 = 1 if pattern_match else 0
 
-        # original ref/ref2 logic
-        ref = 1 if frame_len in [269, 91] else 0
-        ref2 = 1 if frame_len in [301, 269, 317] else 0
+def is_multicast(addr1):
+    """Vectorized test for a multicast/broadcast destination on packed addr1 values."""
+    mask = np.zeros(len(addr1), dtype=bool)
+    for shift, value in MULTICAST_PREFIXES:
+        mask |= (addr1 >> shift) == value
+    return mask
 
-        retry_flag = 1 if dot11.FCfield & 0x8 else 0
 
-        pkt_list.append(
-            {
-                "time": float(pkt.time) - t0,
-                "frame_len": frame_len,
-                "ref": ref,
-                "ref1": ref1,
-                "ref2": ref2,
-                "src_mac": src,
-                "dst_mac": dst,
-                "retry": retry_flag,
-            }
-        )
+def _take_rows(packets, rows):
+    """Subset every column of a packet table."""
+    return {name: col[rows] for name, col in packets.items()}
 
-    if not pkt_list:
-        return pd.DataFrame()
 
-    pkt_list.sort(key=lambda x: x["time"])
-    times = np.array([p["time"] for p in pkt_list])
-    features = []
+def address_matrix(packets):
+    """(N, 3) int64 matrix of addr1..addr3, so one compare covers all three fields."""
+    return np.column_stack((packets["addr1"], packets["addr2"], packets["addr3"]))
 
-    j = 0
-    for i in range(len(times)):
-        while j < len(times) and times[j] - times[i] <= window_size:
-            j += 1
 
-        end_time = times[i] + window_size
-        mask = (times >= times[i]) & (times <= end_time)
-        window_idx = np.where(mask)[0]
-        if len(window_idx) == 0:
-            continue
+# ---------------------------------------------------------------------------
+# Feature extraction (with 24,10 pattern for ref1)
+# ---------------------------------------------------------------------------
 
-        window_pkts = [pkt_list[k] for k in window_idx]
+PATTERN = np.array([24, 10] * 5, dtype=np.int32)
+PATTERN_LEN = len(PATTERN)
 
-        ref = 1 if any(p["ref"] == 1 for p in window_pkts) else 0
-        ref1 = 1 if any(p["ref1"] == 1 for p in window_pkts) else 0
-        ref2 = 1 if any(p["ref2"] == 1 for p in window_pkts) else 0
+# Frame lengths that raise ref / ref2
+REF_LENS = (269, 91)
+REF2_LENS = (301, 269, 317)
 
-        features.append(
-            {
-                "label": label,
-                "window_start": times[i],
-                "window_end": end_time,
-                "ref": ref,
-                "ref1": ref1,
-                "ref2": ref2,
-            }
-        )
 
-    return pd.DataFrame(features)
+def length_in(frame_lens, lengths):
+    """Flag frames whose length is one of a few values (ORed compares beat np.isin here)."""
+    hits = frame_lens == lengths[0]
+    for length in lengths[1:]:
+        hits |= frame_lens == length
+    return hits
 
 
-def classify_device(device_name, row):
+@dataclass
+class FeatureWindows:
     """
-    Map feature refs → "triggering" / "not_triggering" per device type.
+    Sliding feature windows of one device: parallel arrays sorted by
+    window_start, with boolean ref / ref1 / ref2 flags per window.
     """
-    if device_name in [
-        "plug",
-        "wall_plug",
-        "tabel_lamp",
-        "switch",
-        "motion_sensor",
-        "door_sensor",
-    ]:
-        return "triggering" if row.get("ref") == 1 else "not_triggering"
-
-    elif device_name == "air_purifier":
-        return "triggering" if row.get("ref1") == 1 else "not_triggering"
-
-    elif device_name in ["power_strip"]:
-        return "triggering" if row.get("ref2") == 1 else "not_triggering"
+    label: str
+    window_start: np.ndarray
+    window_end: np.ndarray
+    ref: np.ndarray
+    ref1: np.ndarray
+    ref2: np.ndarray
 
-    else:
-        return "unknown_device"
+    def __len__(self):
+        return len(self.window_start)
+
+    def __getitem__(self, column):
+        """Column access by name, like the packet tables and DataFrames."""
+        return getattr(self, column)
+
+
+def select_pair_packets(packets, mac1, mac2, label):
+    """Boolean mask of the packets exchanged between mac1 and mac2 (packed MACs)."""
+    src, dst = packets["addr2"], packets["addr1"]
+
+    # Only keep traffic between device and router
+    keep = ((src == mac1) & (dst == mac2)) | ((src == mac2) & (dst == mac1))
+    if label == "air_purifier":
+        # air purifier special rule: accept packets where dst == mac1 as well
+        keep |= dst == mac1
+    return keep
+
+
+def extract_features_for_mac_pair(packets, mac1, mac2, label, window_size=1.0):
+    """
+    Extract ref / ref1 / ref2 features for traffic between mac1 and mac2
+    (packed MACs), from a capture's packet table. Returns FeatureWindows, or
+    None when the pair exchanged no packets.
+
+    ref1 is raised if we detect the pattern of frame lengths:
+        [24, 10, 24, 10, 24, 10, 24, 10, 24, 10] (24,10 repeated 5 times)
+    """
+    if not len(packets["time"]):
+        return None
+
+    t0 = packets["time"][0]
+
+    keep = select_pair_packets(packets, mac1, mac2, label)
+    if not keep.any():
+        return None
+
+    # Kept packets, in capture order
+    times = packets["time"][keep] - t0
+    frame_lens = packets["frame_len"][keep]
+
+    # original ref/ref2 logic, over the whole column at once
+    ref = length_in(frame_lens, REF_LENS)
+    ref2 = length_in(frame_lens, REF2_LENS)
+
+    # ref1: the last PATTERN_LEN kept frames (in capture order) match PATTERN
+    ref1 = np.zeros(len(frame_lens), dtype=bool)
+    if len(frame_lens) >= PATTERN_LEN:
+        windows = np.lib.stride_tricks.sliding_window_view(frame_lens, PATTERN_LEN)
+        ref1[PATTERN_LEN - 1:] = (windows == PATTERN).all(axis=1)
+
+    order = np.argsort(times, kind="stable")
+    times, ref, ref1, ref2 = times[order], ref[order], ref1[order], ref2[order]
+    # Window i covers every packet with times[i] <= t <= times[i] + window_size;
+    # times is sorted, so that is the slice [lo[i]:hi[i]]
+    end_times = times + window_size
+    lo = np.searchsorted(times, times, side="left")
+    hi = np.searchsorted(times, end_times, side="right")
+
+    # reduceat over interleaved (lo, hi) bounds reduces each window slice in
+    # one call; the padding element keeps hi == len(times) a valid index
+    bounds = np.column_stack((lo, hi)).ravel()
+
+    def any_in_window(flags):
+        padded = np.append(flags, False)
+        return np.logical_or.reduceat(padded, bounds)[::2]
+
+    return FeatureWindows(
+        label=label,
+        window_start=times,
+        window_end=end_times,
+        ref=any_in_window(ref),
+        ref1=any_in_window(ref1),
+        ref2=any_in_window(ref2),
+    )
 
 
 # ---------------------------------------------------------------------------
 # Action detection (per-device behaviour classification)
 # ---------------------------------------------------------------------------
 
-def detect_actions_for_device(frontend_info, device_df, filtered_packets, mac, summary_window=1.0):
+def device_packet_stats(device_packets, code):
+    """
+    Every per-packet counter action detection needs, for the packets that
+    carry the packed MAC `code`, each computed as one array reduction.
+    """
+    stats = {
+        "n_frames": 0,
+        "frame_len_sum": 0,
+        "t_min": None,
+        "t_max": None,
+        "type_counts": (0, 0, 0),  # management / control / data
+        "probe_count": 0,
+        "assoc_count": 0,
+        "auth_count": 0,
+        "small_frames": 0,
+        "large_frames": 0,
+        "mcast_count": 0,
+    }
+    if device_packets is None:
+        return stats
+
+    involved = (address_matrix(device_packets) == code).any(axis=1)
+    n_frames = int(np.count_nonzero(involved))
+    if not n_frames:
+        return stats
+
+    times = device_packets["time"][involved]
+    frame_lens = device_packets["frame_len"][involved]
+    types = device_packets["type"][involved]
+    subtypes = device_packets["subtype"][involved]
+    mgmt_subtypes = subtypes[types == 0]
+    type_counts = np.bincount(types[(types >= 0) & (types <= 2)], minlength=3)
+
+    stats.update(
+        n_frames=n_frames,
+        frame_len_sum=int(frame_lens.sum(dtype=np.int64)),
+        t_min=times.min(),
+        t_max=times.max(),
+        type_counts=tuple(int(c) for c in type_counts),
+        probe_count=int(np.count_nonzero(mgmt_subtypes == 4)),
+        # association request (0) and authentication (11) both count as assoc
+        assoc_count=int(np.count_nonzero((mgmt_subtypes == 0) | (mgmt_subtypes == 11))),
+        auth_count=int(np.count_nonzero(mgmt_subtypes == 11)),
+        small_frames=int(np.count_nonzero(frame_lens < 60)),
+        large_frames=int(np.count_nonzero(frame_lens > 1000)),
+        mcast_count=int(np.count_nonzero(is_multicast(device_packets["addr1"][involved]))),
+    )
+    return stats
+
+
+def detect_actions_for_device(frontend_info, device_windows, device_packets, mac, summary_window=1.0):
     """
-    Infer high-level actions for a single device/mac.
-    Uses:
+    Infer high-level actions for a single device/mac from the packet table
+    of the packets that involve it and its FeatureWindows (each None when
+    there is no capture). Uses:
       - packet type ratios
       - frame sizes
       - probe/assoc/auth counts
@@ -222,6 +391,16 @@ def detect_actions_for_device(frontend_info, device_df, filtered_packets, mac, s
     actions = []
     if not mac:
         return actions
+    code = pack_mac(mac)
+
+    stats = device_packet_stats(device_packets, code)
+    n_frames = stats["n_frames"]
+    probe_count = stats["probe_count"]
+    assoc_count = stats["assoc_count"]
+    auth_count = stats["auth_count"]
+    small_frames = stats["small_frames"]
+    large_frames = stats["large_frames"]
+    mcast_count = stats["mcast_count"]
 
     # --- packet count ratios ---
     packet_types = (
@@ -231,30 +410,23 @@ def detect_actions_for_device(frontend_info, device_df, filtered_packets, mac, s
     total_count = 0
 
     if packet_types and isinstance(packet_types, dict):
-        data_count = packet_types.get("data", {}).get("count", 0)
-        mgmt_count = packet_types.get("management", {}).get("count", 0)
-        ctrl_count = packet_types.get("control", {}).get("count", 0)
+        data_count, mgmt_count, ctrl_count = packet_type_counts(packet_types)
         total_count = data_count + mgmt_count + ctrl_count
 
     if total_count == 0:
+        if device_packets is None and not device_windows:
+            # Nothing to measure: every count and ratio below is zero, and of
+            # all the rules only Idle / Low Activity fires
+            return [
+                {
+                    "action": "Idle / Low Activity",
+                    "confidence": 0.8,
+                    "evidence": {"total_packets": 0},
+                }
+            ]
+
         # fallback: compute from packets
-        for pkt in filtered_packets:
-            if not pkt.haslayer(Dot11):
-                continue
-            dot11 = pkt[Dot11]
-            a1 = normalize_mac(dot11.addr1) if dot11.addr1 else None
-            a2 = normalize_mac(dot11.addr2) if dot11.addr2 else None
-            a3 = normalize_mac(dot11.addr3) if dot11.addr3 else None
-            addrs = {a for a in (a1, a2, a3) if a}
-            if mac not in addrs:
-                continue
-            t = dot11.type
-            if t == 0:
-                mgmt_count += 1
-            elif t == 1:
-                ctrl_count += 1
-            elif t == 2:
-                data_count += 1
+        mgmt_count, ctrl_count, data_count = stats["type_counts"]
         total_count = data_count + mgmt_count + ctrl_count
 
     data_ratio = (data_count / total_count) if total_count > 0 else 0.0
@@ -263,36 +435,12 @@ def detect_actions_for_device(frontend_info, device_df, filtered_packets, mac, s
     total_packets = total_count
 
     # --- per-packet details for this device ---
-    pkt_times = []
-    frame_lens = []
-    for pkt in filtered_packets:
-        if not pkt.haslayer(Dot11):
-            continue
-        dot11 = pkt[Dot11]
-        a1 = normalize_mac(dot11.addr1) if dot11.addr1 else None
-        a2 = normalize_mac(dot11.addr2) if dot11.addr2 else None
-        a3 = normalize_mac(dot11.addr3) if dot11.addr3 else None
-        addrs = {a for a in (a1, a2, a3) if a}
-        if mac not in addrs:
-            continue
-        pkt_times.append(float(pkt.time))
-        frame_lens.append(len(pkt))
-
-    avg_frame_len = float(sum(frame_lens)) / len(frame_lens) if frame_lens else None
+    avg_frame_len = float(stats["frame_len_sum"]) / n_frames if n_frames else None
     pkt_rate = 0.0
-    if pkt_times and len(pkt_times) > 1:
-        duration = max(pkt_times) - min(pkt_times)
+    if n_frames > 1:
+        duration = stats["t_max"] - stats["t_min"]
         if duration > 0:
-            pkt_rate = len(pkt_times) / duration
-
-    total_windows = 0
-    if device_df is not None and not device_df.empty:
-        max_time = device_df["window_end"].max()
-        total_windows = (
-            int(math.ceil(max_time / summary_window))
-            if max_time and summary_window > 0
-            else 0
-        )
+            pkt_rate = n_frames / duration
 
     def norm01(x, mn, mx):
         if mx <= mn:
@@ -353,22 +501,6 @@ def detect_actions_for_device(frontend_info, device_df, filtered_packets, mac, s
         )
 
     # --- Probe / Scanning ---
-    probe_count = 0
-    for pkt in filtered_packets:
-        if not pkt.haslayer(Dot11):
-            continue
-        dot11 = pkt[Dot11]
-        a1 = normalize_mac(dot11.addr1) if dot11.addr1 else None
-        a2 = normalize_mac(dot11.addr2) if dot11.addr2 else None
-        a3 = normalize_mac(dot11.addr3) if dot11.addr3 else None
-        addrs = {a for a in (a1, a2, a3) if a}
-        if mac not in addrs:
-            continue
-        try:
-            if dot11.type == 0 and dot11.subtype == 4:
-                probe_count += 1
-        except Exception:
-            pass
     if probe_count > 5:
         conf = min(1.0, probe_count / 50.0 + 0.3)
         actions.append(
@@ -380,25 +512,6 @@ def detect_actions_for_device(frontend_info, device_df, filtered_packets, mac, s
         )
 
     # --- Association / Authentication ---
-    assoc_count = 0
-    auth_count = 0
-    for pkt in filtered_packets:
-        if not pkt.haslayer(Dot11):
-            continue
-        dot11 = pkt[Dot11]
-        a1 = normalize_mac(dot11.addr1) if dot11.addr1 else None
-        a2 = normalize_mac(dot11.addr2) if dot11.addr2 else None
-        a3 = normalize_mac(dot11.addr3) if dot11.addr3 else None
-        addrs = {a for a in (a1, a2, a3) if a}
-        if mac not in addrs:
-            continue
-        try:
-            if dot11.type == 0 and dot11.subtype in (0, 11):
-                assoc_count += 1
-            if dot11.type == 0 and dot11.subtype == 11:
-                auth_count += 1
-        except Exception:
-            pass
     if assoc_count + auth_count > 2:
         conf = min(1.0, (assoc_count + auth_count) / 10.0 + 0.4)
         actions.append(
@@ -413,8 +526,7 @@ def detect_actions_for_device(frontend_info, device_df, filtered_packets, mac, s
         )
 
     # --- Keep-Alive / Heartbeat ---
-    small_frames = sum(1 for l in frame_lens if l < 60) if frame_lens else 0
-    small_ratio = (small_frames / len(frame_lens)) if frame_lens else 0.0
+    small_ratio = (small_frames / n_frames) if n_frames else 0.0
     if small_ratio > 0.5 and total_packets > 10 and data_ratio < 0.2:
         conf = 0.6 * norm01(small_ratio, 0.5, 1.0) + 0.4 * norm01(
             total_packets, 10, 200
@@ -445,7 +557,6 @@ def detect_actions_for_device(frontend_info, device_df, filtered_packets, mac, s
         )
 
     # --- Firmware / OTA (possible) ---
-    large_frames = sum(1 for l in frame_lens if l > 1000) if frame_lens else 0
     if data_ratio > 0.6 and large_frames > 50:
         conf = min(1.0, 0.4 + norm01(large_frames, 50, 500))
         actions.append(
@@ -460,22 +571,6 @@ def detect_actions_for_device(frontend_info, device_df, filtered_packets, mac, s
         )
 
     # --- ARP / Local Discovery ---
-    mcast_count = sum(
-        1
-        for pkt in filtered_packets
-        if pkt.haslayer(Dot11)
-        and normalize_mac(pkt[Dot11].addr1)
-        and (
-            normalize_mac(pkt[Dot11].addr1).startswith("ff:ff:ff")
-            or normalize_mac(pkt[Dot11].addr1).startswith("33:33")
-        )
-        and mac
-        in {
-            normalize_mac(pkt[Dot11].addr1),
-            normalize_mac(pkt[Dot11].addr2),
-            normalize_mac(pkt[Dot11].addr3),
-        }
-    )
     if mcast_count > 5:
         conf = min(1.0, 0.3 + norm01(mcast_count, 5, 200))
         actions.append(
@@ -488,10 +583,8 @@ def detect_actions_for_device(frontend_info, device_df, filtered_packets, mac, s
 
     # --- Power Toggle / Actuation ---
     actuation_windows = 0
-    if device_df is not None and not device_df.empty:
-        for _, r in device_df.iterrows():
-            if r.get("ref") == 1 or r.get("ref1") == 1:
-                actuation_windows += 1
+    for windows in device_windows or ():
+        actuation_windows += int(np.count_nonzero(windows.ref | windows.ref1))
     if actuation_windows > 0 and (total_packets < 200 or data_ratio < 0.2):
         conf = min(1.0, 0.3 + norm01(actuation_windows, 1, 10))
         actions.append(
@@ -506,12 +599,7 @@ def detect_actions_for_device(frontend_info, device_df, filtered_packets, mac, s
         )
 
     # --- Motion Trigger (for sensors) ---
-    spike_detected = False
-    if device_df is not None and not device_df.empty:
-        counts = [
-            (r.get("ref") == 1 or r.get("ref1") == 1) for _, r in device_df.iterrows()
-        ]
-        spike_detected = any(counts)
+    spike_detected = actuation_windows > 0
     if spike_detected and (total_packets < 300):
         actions.append(
             {
@@ -556,6 +644,46 @@ def detect_actions_for_device(frontend_info, device_df, filtered_packets, mac, s
     return actions
 
 
+# ---------------------------------------------------------------------------
+# Router inference
+# ---------------------------------------------------------------------------
+
+# (configured slot, peer slot) address pairs, in the order peers are counted
+ROUTER_PEER_SLOTS = (
+    ("addr1", "addr2"), ("addr1", "addr3"),
+    ("addr2", "addr1"), ("addr2", "addr3"),
+    ("addr3", "addr1"), ("addr3", "addr2"),
+)
+
+
+def infer_router(packets, configured_macs):
+    """
+    Packed MAC that most often shares a packet with a configured device without
+    being one itself, or None. Every (configured, peer) address pairing in a
+    packet counts once; ties go to the MAC counted first in capture order.
+    """
+    configured = np.fromiter(configured_macs, dtype=np.int64, count=len(configured_macs))
+    is_configured = {
+        slot: np.isin(packets[slot], configured) for slot in ("addr1", "addr2", "addr3")
+    }
+
+    peers, positions = [], []
+    for rank, (slot, peer_slot) in enumerate(ROUTER_PEER_SLOTS):
+        peer = packets[peer_slot]
+        rows = np.flatnonzero(is_configured[slot] & ~is_configured[peer_slot] & (peer != NO_MAC))
+        peers.append(peer[rows])
+        positions.append(rows * len(ROUTER_PEER_SLOTS) + rank)
+
+    peers = np.concatenate(peers)
+    if not len(peers):
+        return None
+
+    peers = peers[np.argsort(np.concatenate(positions), kind="stable")]
+    macs, first_seen, counts = np.unique(peers, return_index=True, return_counts=True)
+    best = np.flatnonzero(counts == counts.max())
+    return int(macs[best[np.argmin(first_seen[best])]])
+
+
 # ---------------------------------------------------------------------------
 # PCAP processing and trigger sequence extraction
 # ---------------------------------------------------------------------------
@@ -579,11 +707,6 @@ def process_pcap_auto(
         - air_purifier: window with max trigger_count
     - Enrich with frontend metadata (vendor, last_seen, etc.)
     """
-    try:
-        packets = rdpcap(pcap_file)
-    except Exception as e:
-        raise RuntimeError(f"Failed to read pcap '{pcap_file}': {e}")
-
     device_configs = []
     configured_macs = set()
     frontend_map = {}
@@ -613,9 +736,10 @@ def process_pcap_auto(
                 "mac1": mac,
                 "mac2": None,
                 "label": device_type,
+                "code1": pack_mac(mac),
             }
         )
-        configured_macs.add(mac)
+        configured_macs.add(pack_mac(mac))
 
         # keep original frontend info for enrichment
         d_copy = dict(d)
@@ -640,8 +764,9 @@ def process_pcap_auto(
             if m:
                 return f"{friendly_type} ({int(m.group(1))})"
 
+        # entries hold the MACs normalized while building device_configs
         for pos, e in enumerate(entries, start=1):
-            if normalize_mac(e.get("mac")) == mac:
+            if e["mac"] == mac:
                 return f"{friendly_type} ({pos})"
 
         return f"{friendly_type} (1)"
@@ -649,55 +774,56 @@ def process_pcap_auto(
     # --- router BSSID handling ---
     normalized_router = normalize_mac(router_bssid) if router_bssid else None
 
-    # If router BSSID not provided, infer from traffic between configured devices and other MACs
-    if not normalized_router:
-        counter = {}
-        for pkt in packets:
-            if not pkt.haslayer(Dot11):
-                continue
-            a1 = normalize_mac(pkt[Dot11].addr1) if pkt[Dot11].addr1 else None
-            a2 = normalize_mac(pkt[Dot11].addr2) if pkt[Dot11].addr2 else None
-            a3 = normalize_mac(pkt[Dot11].addr3) if pkt[Dot11].addr3 else None
-            if a1 in configured_macs:
-                if a2 and a2 not in configured_macs:
-                    counter[a2] = counter.get(a2, 0) + 1
-                if a3 and a3 not in configured_macs:
-                    counter[a3] = counter.get(a3, 0) + 1
-            if a2 in configured_macs:
-                if a1 and a1 not in configured_macs:
-                    counter[a1] = counter.get(a1, 0) + 1
-                if a3 and a3 not in configured_macs:
-                    counter[a3] = counter.get(a3, 0) + 1
-            if a3 in configured_macs:
-                if a1 and a1 not in configured_macs:
-                    counter[a1] = counter.get(a1, 0) + 1
-                if a2 and a2 not in configured_macs:
-                    counter[a2] = counter.get(a2, 0) + 1
-        if counter:
-            normalized_router = max(counter.items(), key=lambda x: x[1])[0]
+    # Only packets carrying a configured MAC (or the given router) are
+    # dissected; nothing else can reach the filter below
+    wanted = set(configured_macs)
+    if normalized_router:
+        wanted.add(pack_mac(normalized_router))
+    try:
+        packets = load_dot11_table(pcap_file, wanted)
+
+        # If router BSSID not provided, infer from traffic between configured devices and other MACs
+        if not normalized_router:
+            inferred = infer_router(packets, configured_macs)
+            if inferred is not None:
+                normalized_router = unpack_mac(inferred)
+                # Add the router's packets that carry no configured MAC
+                packets = merge_tables(
+                    packets, load_dot11_table(pcap_file, {inferred}, configured_macs)
+                )
+    except Exception as e:
+        raise RuntimeError(f"Failed to read pcap '{pcap_file}': {e}")
+    router_code = pack_mac(normalized_router)
 
     # plug router BSSID into each device config
     for conf in device_configs:
         conf["mac2"] = normalized_router
+        conf["code2"] = router_code
 
     # We only care about packets touching (device, router)
     interested_macs = set(configured_macs)
     if normalized_router:
-        interested_macs.add(normalized_router)
+        interested_macs.add(router_code)
+    interested = np.fromiter(interested_macs, dtype=np.int64, count=len(interested_macs))
+
+    # Filtered once here; every later pass reads this same table
+    keep = np.flatnonzero(
+        np.isin(packets["addr1"], interested)
+        | np.isin(packets["addr2"], interested)
+        | np.isin(packets["addr3"], interested)
+    )
+    packet_table = _take_rows(packets, keep)
+    del packets
 
-    filtered_packets = []
-    for pkt in packets:
-        if not pkt.haslayer(Dot11):
-            continue
-        a1 = normalize_mac(pkt[Dot11].addr1) if pkt[Dot11].addr1 else None
-        a2 = normalize_mac(pkt[Dot11].addr2) if pkt[Dot11].addr2 else None
-        a3 = normalize_mac(pkt[Dot11].addr3) if pkt[Dot11].addr3 else None
-        if (
-            (a1 in interested_macs)
-            or (a2 in interested_macs)
-            or (a3 in interested_macs)
-        ):
-            filtered_packets.append(pkt)
+    addrs = address_matrix(packet_table)
+    involves_router = (addrs == router_code).any(axis=1)
+
+    # Rows touching each configured MAC, found in one pass per MAC and shared
+    # by the packet counts and the per-device action detection below
+    device_rows = {}
+    for conf in device_configs:
+        if conf["mac1"] not in device_rows:
+            device_rows[conf["mac1"]] = np.flatnonzero((addrs == conf["code1"]).any(axis=1))
 
     # Count packets where both device MAC and router MAC appear
     device_packet_counts = {}
@@ -707,40 +833,23 @@ def process_pcap_auto(
         if not mac1:
             continue
         count = 0
-        for pkt in filtered_packets:
-            if not pkt.haslayer(Dot11):
-                continue
-            a1 = normalize_mac(pkt[Dot11].addr1) if pkt[Dot11].addr1 else None
-            a2 = normalize_mac(pkt[Dot11].addr2) if pkt[Dot11].addr2 else None
-            a3 = normalize_mac(pkt[Dot11].addr3) if pkt[Dot11].addr3 else None
-            addrs = {a for a in (a1, a2, a3) if a}
-            if mac2 and mac1 in addrs and mac2 in addrs:
-                count += 1
+        if mac2:
+            count = int(np.count_nonzero(involves_router[device_rows[mac1]]))
         device_packet_counts[mac1] = count
 
-    # --- per-device feature DF (per mac1) ---
-    all_results = []
-    for device in device_configs:
-        device_type = device["device_type"]
-        mac1 = device["mac1"]
-        mac2 = device["mac2"]
-        label = device["label"]
-
-        if not mac2:
-            continue
-
-        df = extract_features_for_mac_pair(
-            filtered_packets, mac1, mac2, label, window_size
+    # --- per-device feature windows (per mac1) ---
+    def process_device(device):
+        if not device["mac2"]:
+            return None
+        return extract_features_for_mac_pair(
+            packet_table, device["code1"], device["code2"], device["label"], window_size
         )
-        if df.empty:
-            continue
 
-        df["mac"] = mac1
-        df["device"] = device["device_name"] or mac1
-        df["device_type"] = device_type
-        df["label"] = label
-        df["predicted"] = df.apply(lambda r: classify_device(device_type, r), axis=1)
-        all_results.append(df)
+    all_results = [
+        (device, windows)
+        for device, windows in zip(device_configs, map_devices(process_device, device_configs))
+        if windows is not None
+    ]
 
     if not all_results:
         return {
@@ -749,8 +858,6 @@ def process_pcap_auto(
             "router_bssid": normalized_router,
         }
 
-    final_df = pd.concat(all_results).sort_values("window_start").reset_index(drop=True)
-
     # -----------------------------------------------------------------------
     # Trigger sequence construction:
     #   - For each (label, mac) pair:
@@ -759,81 +866,85 @@ def process_pcap_auto(
     # -----------------------------------------------------------------------
     trigger_sequence = []
 
-    seen_pairs = []
-    for _, row in final_df.iterrows():
-        pair = (row["label"], row["mac"])
-        if pair not in seen_pairs:
-            seen_pairs.append(pair)
-
-    for label, mac in seen_pairs:
-        device_df = final_df[(final_df["label"] == label) & (final_df["mac"] == mac)]
-        max_time = device_df["window_end"].max()
-        current_start = 0.0
-
-        best_window = None
-        first_window_found = False
-        rep_device_name = (
-            device_df["device"].iloc[0]
-            if "device" in device_df.columns and len(device_df)
-            else None
+    # (label, mac) pairs ordered by their earliest window (ties: config
+    # order); each device's windows are sorted, so its first one is earliest
+    pair_first = {}
+    for pos, (device, windows) in enumerate(all_results):
+        pair = (device["label"], device["mac1"])
+        first = (windows.window_start[0], pos)
+        if pair not in pair_first or first < pair_first[pair]:
+            pair_first[pair] = first
+    seen_pairs = sorted(pair_first, key=pair_first.get)
+    pair_code = {pair: code for code, pair in enumerate(seen_pairs)}
+    rep_device_names = []
+    for pair in seen_pairs:
+        device = all_results[pair_first[pair][1]][0]
+        rep_device_names.append(device["device_name"] or device["mac1"])
+
+    # One bincount over (pair, summary bucket) replaces rescanning each
+    # pair's windows once per bucket
+    edges, counts = count_triggers_per_bucket(
+        np.repeat(
+            [pair_code[(device["label"], device["mac1"])] for device, _ in all_results],
+            [len(windows) for _, windows in all_results],
+        ),
+        np.concatenate([windows.window_start for _, windows in all_results]),
+        np.concatenate([windows.window_end for _, windows in all_results]),
+        np.concatenate(
+            [
+                classify_windows(device["device_type"], windows) == "triggering"
+                for device, windows in all_results
+            ]
+        ),
+        len(seen_pairs),
+        summary_window,
+    )
+
+    for code, (label, mac) in enumerate(seen_pairs):
+        pair_counts = counts[code]
+        if not pair_counts.any():
+            continue
+
+        if label == "air_purifier":
+            # For air purifier, take the window with highest trigger_count
+            k = int(np.argmax(pair_counts))
+        else:
+            # For others, first triggering window only
+            k = int(np.argmax(pair_counts > 0))
+
+        trigger_sequence.append(
+            {
+                "label": label,
+                "device_name": rep_device_names[code],
+                "device_type": label,
+                "mac_address": mac,
+                "start": round(float(edges[k]), 3),
+                "end": round(float(edges[k + 1]), 3),
+                "trigger_count": int(pair_counts[k]),
+            }
         )
 
-        while current_start < max_time:
-            current_end = current_start + summary_window
-            mask = (device_df["window_start"] >= current_start) & (
-                device_df["window_start"] < current_end
-            )
-            window_df = device_df[mask]
-
-            trigger_count = int(sum(window_df["predicted"] == "triggering"))
-
-            if trigger_count > 0:
-                if label == "air_purifier":
-                    # For air purifier, take the window with highest trigger_count
-                    if (
-                        best_window is None
-                        or trigger_count > best_window["trigger_count"]
-                    ):
-                        best_window = {
-                            "label": label,
-                            "device_name": rep_device_name,
-                            "device_type": label,
-                            "mac_address": mac,
-                            "start": round(float(current_start), 3),
-                            "end": round(float(current_end), 3),
-                            "trigger_count": int(trigger_count),
-                        }
-                else:
-                    # For others, first triggering window only
-                    if not first_window_found:
-                        trigger_sequence.append(
-                            {
-                                "label": label,
-                                "device_name": rep_device_name,
-                                "device_type": label,
-                                "mac_address": mac,
-                                "start": round(float(current_start), 3),
-                                "end": round(float(current_end), 3),
-                                "trigger_count": int(trigger_count),
-                            }
-                        )
-                        first_window_found = True
-
-            current_start += summary_window
-
-        if label == "air_purifier" and best_window is not None:
-            trigger_sequence.append(best_window)
+    # Feature windows of every device, grouped by label, and the number of
+    # summary windows up to each label's latest window end (same for every
+    # entry sharing that label, so the ceil runs once per label)
+    label_windows = {}
+    for device, windows in all_results:
+        label_windows.setdefault(device["label"], []).append(windows)
+    total_windows_by_label = {}
+    for label, windows in label_windows.items():
+        max_time = max(w.window_end.max() for w in windows)
+        total_windows_by_label[label] = (
+            int(math.ceil(max_time / summary_window))
+            if max_time and summary_window > 0
+            else 0
+        )
 
     # -----------------------------------------------------------------------
     # Enrich trigger sequence with frontend metadata & actions
     # -----------------------------------------------------------------------
-    enriched_sequence = []
-    for entry in trigger_sequence:
+    def enrich_entry(entry):
         mac = entry.get("mac_address")
-        if not mac:
-            rows = final_df[final_df["label"] == entry.get("label")]
-            if not rows.empty:
-                mac = rows["mac"].iloc[0]
+        label = entry.get("label")
 
         frontend_info = frontend_map.get(mac, {}) if mac else {}
 
@@ -853,7 +964,7 @@ def process_pcap_auto(
         device_type_label = (
             frontend_info.get("device_type")
             or entry.get("device_type")
-            or entry.get("label")
+            or label
             or ""
         )
 
@@ -869,21 +980,12 @@ def process_pcap_auto(
 
         data_ratio = None
         if packet_types and isinstance(packet_types, dict):
-            data_count = packet_types.get("data", {}).get("count", 0)
-            total_count = (
-                packet_types.get("data", {}).get("count", 0)
-                + packet_types.get("management", {}).get("count", 0)
-                + packet_types.get("control", {}).get("count", 0)
-            )
+            data_count, mgmt_count, ctrl_count = packet_type_counts(packet_types)
+            total_count = data_count + mgmt_count + ctrl_count
             data_ratio = (data_count / total_count) if total_count > 0 else 0.0
 
-        device_rows = final_df[final_df["label"] == entry.get("label")]
-        max_time = device_rows["window_end"].max() if not device_rows.empty else 0
-        total_windows = (
-            int(math.ceil(max_time / summary_window))
-            if max_time and summary_window > 0
-            else 0
-        )
+        device_windows = label_windows.get(label, [])
+        total_windows = total_windows_by_label.get(label, 0)
 
         trigger_count = int(entry.get("trigger_count", 0))
 
@@ -895,21 +997,13 @@ def process_pcap_auto(
         )
 
         # packets for this device only (for action detection)
-        per_device_filtered = []
+        per_device_filtered = None
         if mac:
-            for pkt in filtered_packets:
-                if not pkt.haslayer(Dot11):
-                    continue
-                a1 = normalize_mac(pkt[Dot11].addr1) if pkt[Dot11].addr1 else None
-                a2 = normalize_mac(pkt[Dot11].addr2) if pkt[Dot11].addr2 else None
-                a3 = normalize_mac(pkt[Dot11].addr3) if pkt[Dot11].addr3 else None
-                addrs = {a for a in (a1, a2, a3) if a}
-                if mac in addrs:
-                    per_device_filtered.append(pkt)
+            per_device_filtered = _take_rows(packet_table, device_rows[mac])
 
         actions = detect_actions_for_device(
             frontend_info,
-            device_rows,
+            device_windows,
             per_device_filtered,
             mac,
             summary_window,
@@ -918,7 +1012,7 @@ def process_pcap_auto(
         enriched = {
             "device_name": display_device_name,
             "device_type": friendly_device_type,
-            "label": entry.get("label"),
+            "label": label,
             "mac_address": mac,
             "start": entry.get("start"),
             "end": entry.get("end"),
@@ -931,10 +1025,13 @@ def process_pcap_auto(
             "prediction_confidence": pred_conf,
             "actions": actions,
         }
-        enriched_sequence.append(enriched)
+        return enriched
+
+    enriched_sequence = [enrich_entry(entry) for entry in trigger_sequence]
 
-    # Sort chronologically and add order
-    enriched_sequence = sorted(enriched_sequence, key=lambda x: x["start"] or 0)
+    # Sort chronologically (in place; already-ordered input is a single
+    # timsort run, checked in one pass) and add order
+    enriched_sequence.sort(key=lambda x: x["start"] or 0)
     for idx, item in enumerate(enriched_sequence, start=1):
         item["order"] = idx
 
@@ -949,6 +1046,18 @@ def process_pcap_auto(
 # Flask endpoint
 # ---------------------------------------------------------------------------
 
+def json_response(payload, status=200):
+    """
+    jsonify(payload), status — encoded with orjson when it is installed.
+    Keys are sorted like Flask's encoder, and NumPy scalars are accepted the
+    way the stdlib encoder takes np.float64 as a float.
+    """
+    if orjson is None:
+        return jsonify(payload), status
+    body = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return Response(body, status=status, mimetype="application/json")
+
+
 @deviceaction_bp.route("/analyze-actions", methods=["POST"])
 def analyze_actions_endpoint():
     try:
@@ -985,9 +1094,10 @@ def analyze_actions_endpoint():
                     404,
                 )
 
-            capture_files = [
-                f for f in os.listdir(downloads_dir) if f.endswith((".cap", ".pcap"))
-            ]
+            # DirEntry caches its stat result (on Windows it comes with the
+            # listing itself), so there is no separate getmtime() per file
+            with os.scandir(downloads_dir) as it:
+                capture_files = [e for e in it if e.name.endswith((".cap", ".pcap"))]
             if not capture_files:
                 return (
                     jsonify(
@@ -999,8 +1109,7 @@ def analyze_actions_endpoint():
                     404,
                 )
 
-            capture_files_full = [os.path.join(downloads_dir, f) for f in capture_files]
-            pcap_file = max(capture_files_full, key=os.path.getmtime)
+            pcap_file = max(capture_files, key=lambda e: e.stat().st_mtime).path
 
         analysis = process_pcap_auto(
             pcap_file=pcap_file,
@@ -1014,15 +1123,14 @@ def analyze_actions_endpoint():
         router_bssid = analysis.get("router_bssid")
         total_devices = analysis.get("total_devices", 0)
 
-        # Map mac -> max trigger_count
+        # Map mac -> max trigger_count (entries built by process_pcap_auto
+        # always carry both keys; a missing mac reads as 0 below)
         triggered_map = {}
         for item in trigger_sequence:
-            mac = item.get("mac_address")
-            if not mac:
-                continue
-            triggered_map[mac] = max(
-                triggered_map.get(mac, 0), item.get("trigger_count", 0)
-            )
+            mac = item["mac_address"]
+            trigger_count = item["trigger_count"]
+            if trigger_count > triggered_map.get(mac, 0):
+                triggered_map[mac] = trigger_count
 
         # Build devices_processed list for UI
         devices_processed = []
@@ -1051,18 +1159,15 @@ def analyze_actions_endpoint():
             packet_types = d.get("packet_types") or d.get("packetTypes") or None
             total_packets_frontend = None
             if packet_types and isinstance(packet_types, dict):
-                total_packets_frontend = (
-                    packet_types.get("data", {}).get("count", 0)
-                    + packet_types.get("management", {}).get("count", 0)
-                    + packet_types.get("control", {}).get("count", 0)
-                )
+                data_count, mgmt_count, ctrl_count = packet_type_counts(packet_types)
+                total_packets_frontend = data_count + mgmt_count + ctrl_count
 
             trigger_count = triggered_map.get(mac, 0)
             triggered_flag = "yes" if trigger_count > 0 else "no"
 
             # Simple actions based solely on aggregated counts (no PCAP windows)
             actions = detect_actions_for_device(
-                d, None, [], mac, summary_window=1.0
+                d, None, None, mac, summary_window=1.0
             )
 
             devices_processed.append(
@@ -1102,8 +1207,8 @@ def analyze_actions_endpoint():
             "total_devices_processed": total_devices,
             "analysis_timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
         }
-        return jsonify(response)
+        return json_response(response)
 
     except Exception as e:
         print(f"[ERROR] analyze-actions failed: {e}")
-        return jsonify({"status": "error", "error": str(e)}), 500
+        return json_response({"status": "error", "error": str(e)}, 500)
@@ -0,0 +1,129 @@
+# modules/ssh_pool.py
+import threading
+import paramiko
+
+from modules.config import PI_HOST, PI_USER, PI_PASS, SSH_PORT
+
+
+# ============================================================
+# SHARED SSH CONNECTION TO THE RASPBERRY PI
+# ============================================================
+KEEPALIVE_INTERVAL = 30  # seconds
+
+HOST_KEY_POLICY = paramiko.AutoAddPolicy()
+
+# Password auth only: skipping the agent and ~/.ssh key probing saves work on
+# every connect()
+SSH_CONNECT_KWARGS = {
+    "hostname": PI_HOST,
+    "port": SSH_PORT,
+    "username": PI_USER,
+    "password": PI_PASS,
+    "timeout": 10,
+    "banner_timeout": 20,
+    "auth_timeout": 20,
+    "allow_agent": False,
+    "look_for_keys": False,
+}
+
+_ssh_lock = threading.Lock()
+_ssh_client = None
+
+
+def _connect():
+    """Open a new SSH connection to the Raspberry Pi"""
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(HOST_KEY_POLICY)
+    ssh.connect(**SSH_CONNECT_KWARGS)
+    ssh.get_transport().set_keepalive(KEEPALIVE_INTERVAL)
+    return ssh
+
+
+def get_ssh():
+    """
+    Return the backend-wide SSH client, connecting on first use and
+    reconnecting whenever the transport has dropped.
+    """
+    global _ssh_client
+    with _ssh_lock:
+        transport = _ssh_client.get_transport() if _ssh_client else None
+        if transport is None or not transport.is_active():
+            _close(_ssh_client)
+            _ssh_client = _connect()
+        return _ssh_client
+
+
+def warm_up():
+    """Connect in the background at startup so the first route finds a live client."""
+    def connect():
+        try:
+            get_ssh()
+        except Exception as e:
+            print(f"[WARN] SSH warm-up to {PI_HOST} failed: {e}")
+
+    threading.Thread(target=connect, daemon=True).start()
+
+
+def reset_ssh():
+    """Drop the shared client; the next get_ssh() opens a fresh connection."""
+    global _ssh_client
+    with _ssh_lock:
+        _close(_ssh_client)
+        _ssh_client = None
+
+
+def run(cmd, pty=False):
+    """
+    Start cmd on a new channel of the shared transport and return the channel,
+    for commands that only need an exit status rather than stdout file objects.
+    """
+    return _retry_once(lambda: _start(get_ssh(), cmd, pty))
+
+
+def run_dedicated(cmd, pty=False):
+    """
+    Start a long-running cmd on a connection of its own and return
+    (ssh, channel). A reset of the shared connection never reaches it; the
+    caller closes ssh once the command is done.
+    """
+    ssh = _connect()
+    try:
+        return ssh, _start(ssh, cmd, pty)
+    except Exception:
+        _close(ssh)
+        raise
+
+
+def _start(ssh, cmd, pty):
+    chan = ssh.get_transport().open_session()
+    if pty:
+        chan.get_pty()
+    chan.exec_command(cmd)
+    return chan
+
+
+def _retry_once(start):
+    try:
+        return start()
+    except (paramiko.SSHException, EOFError, OSError):
+        # Only a dead transport is replaced. A refused channel (e.g. a
+        # ChannelException at the Pi's MaxSessions limit) leaves it healthy,
+        # and resetting would close every other channel open on it, so just
+        # retry on the same client
+        if not _transport_active():
+            reset_ssh()
+        return start()
+
+
+def _transport_active():
+    with _ssh_lock:
+        transport = _ssh_client.get_transport() if _ssh_client else None
+        return transport is not None and transport.is_active()
+
+
+def _close(ssh):
+    if ssh:
+        try:
+            ssh.close()
+        except Exception:
+            pass
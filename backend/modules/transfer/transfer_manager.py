@@ -10,7 +10,12 @@ from modules.transfer.config import (
     LOCAL_DOWNLOAD_DIR,
 )
 
-from modules.config import PI_HOST, PI_USER, PI_PASS, SSH_PORT
+from modules.ssh_pool import HOST_KEY_POLICY, SSH_CONNECT_KWARGS
+
+# SFTP channel tuning: a 4 MiB window keeps enough requests in flight to fill
+# the LAN link, packets stay at the 32 KiB the SFTP server reads per request
+SFTP_WINDOW_SIZE = 4 * 1024 * 1024
+SFTP_MAX_PACKET_SIZE = 32 * 1024
 
 
 class TransferError(Exception):
@@ -22,8 +27,8 @@ class TransferError(Exception):
 def _connect_ssh():
     """Create and return an SSH client connection to Raspberry Pi"""
     ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect(PI_HOST, port=SSH_PORT, username=PI_USER, password=PI_PASS, timeout=10)
+    ssh.set_missing_host_key_policy(HOST_KEY_POLICY)
+    ssh.connect(**SSH_CONNECT_KWARGS)
     return ssh
 
 
@@ -55,19 +60,29 @@ def get_latest_remote_capture(sftp, remote_dir=REMOTE_CAPTURE_DIR, pattern=".cap
     return remote_path
 
 
-def download_file_from_pi(remote_path=None, local_dir=LOCAL_DOWNLOAD_DIR, timeout=60):
+def download_file_from_pi(remote_path=None, local_dir=LOCAL_DOWNLOAD_DIR, timeout=60,
+                          wait_for=None):
     """
     Downloads the latest capture file from Raspberry Pi → backend (Windows).
     After download:
        Moves it into Archive/<DDMMYYYY>/<HHMM>/ on the Pi.
        Cleans up /Capture/ (removes leftover capture-* files).
+    If wait_for (a threading.Event) is given, the SSH/SFTP session is set up
+    straight away but the capture is only looked up once it is set.
     """
     ssh = None
     sftp = None
     try:
         print("[DEBUG] Connecting to Raspberry Pi via SSH...")
         ssh = _connect_ssh()
-        sftp = ssh.open_sftp()
+        sftp = paramiko.SFTPClient.from_transport(
+            ssh.get_transport(),
+            window_size=SFTP_WINDOW_SIZE,
+            max_packet_size=SFTP_MAX_PACKET_SIZE,
+        )
+
+        if wait_for is not None:
+            wait_for.wait()
 
         # === Find latest capture file ===
         if not remote_path:
@@ -85,7 +100,7 @@ def download_file_from_pi(remote_path=None, local_dir=LOCAL_DOWNLOAD_DIR, timeou
         local_path = os.path.join(local_dir, base_name)
 
         print(f"[INFO] Downloading {remote_path} → {local_path}")
-        sftp.get(remote_path, local_path)
+        sftp.get(remote_path, local_path, prefetch=True)
 
         # === Verify downloaded file ===
         if not os.path.exists(local_path) or os.path.getsize(local_path) == 0:
@@ -0,0 +1,71 @@
+# modules/trigger_windows.py
+"""
+Per-device fan-out, window classification rules and summary-window counting,
+shared by the offline device_classification script and the device-action
+analysis.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def map_devices(fn, devices):
+    """
+    [fn(device) for device in devices], run on a thread pool. Each device only
+    reads the shared packet table, and the heavy steps are NumPy calls that
+    release the GIL, so threads overlap; results keep the input order.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, min(len(devices), os.cpu_count() or 1))) as pool:
+        return list(pool.map(fn, devices))
+
+
+# Feature column whose flag marks a window as triggering, per device type.
+# Device types missing here are classified as "unknown_device".
+DEVICE_COL = {
+    "plug": "ref",
+    "wall_plug": "ref",
+    "tabel_lamp": "ref",
+    "switch": "ref",
+    "motion_sensor": "ref",
+    "door_sensor": "ref",
+    "air_purifier": "ref1",
+    "power_strip": "ref2",
+}
+
+
+def classify_windows(device_type, windows):
+    """
+    Map feature refs → "triggering" / "not_triggering" for every window of a
+    device of the given type. windows is any per-window table indexed by
+    column name (a DataFrame or FeatureWindows).
+    """
+    trigger_col = DEVICE_COL.get(device_type)
+    if trigger_col is None:
+        return np.full(len(windows), "unknown_device", dtype=object)
+    return np.where(np.asarray(windows[trigger_col]) == 1, "triggering", "not_triggering")
+
+
+def count_triggers_per_bucket(codes, window_start, window_end, triggered,
+                              n_groups, summary_window):
+    """
+    Count triggering feature windows per (group, summary bucket) in one pass.
+
+    Bucket k spans [edges[k], edges[k + 1]); a group only has the buckets that
+    start before its own latest window_end, later cells are left at zero.
+    """
+    max_times = np.full(n_groups, -np.inf)
+    np.maximum.at(max_times, codes, window_end)
+
+    # Edges accumulate summary_window step by step (cumsum is sequential), so
+    # bucket bounds are bit-identical to repeatedly doing `start += summary_window`
+    n_steps = int(np.ceil(max_times.max() / summary_window)) + 2
+    edges = np.concatenate(([0.0], np.cumsum(np.full(n_steps, summary_window))))
+    n_buckets = np.searchsorted(edges, max_times, side="left")
+    width = int(n_buckets.max())
+
+    buckets = np.searchsorted(edges, window_start, side="right") - 1
+    hit = triggered & (buckets >= 0) & (buckets < n_buckets[codes])
+    counts = np.bincount(codes[hit] * width + buckets[hit],
+                         minlength=n_groups * width).reshape(n_groups, width)
+    return edges, counts
@@ -3,6 +3,7 @@ from flask import Flask
 from flask_cors import CORS
 import threading
 import modules.config as config
+from modules import ssh_pool
 
 # Import Blueprints
 from modules.capture.capture_manager import capture_bp, init_capture_globals
@@ -33,6 +34,9 @@ globals_dict = {
 # Inject shared globals into capture manager
 init_capture_globals(globals_dict)
 
+# Open the shared SSH connection to the Pi ahead of the first request
+ssh_pool.warm_up()
+
 # ============================================================
 # REGISTER BLUEPRINTS
 # ============================================================
@@ -0,0 +1,41 @@
+# tests/test_analysis_manager.py
+# Run from backend/: python -m unittest discover -s tests -t .
+import os
+import unittest
+
+from flask import Flask
+
+from modules.analysis.analysis_manager import analysis_bp, _canonical_mac
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CAPTURE = os.path.join(BACKEND_DIR, "capture-01.cap")
+
+
+class CanonicalMacTest(unittest.TestCase):
+    def test_separators_and_case(self):
+        self.assertEqual(_canonical_mac("14-EB-B6-BE-D7-1E"), "14:eb:b6:be:d7:1e")
+
+    def test_rejects_non_hex(self):
+        self.assertIsNone(_canonical_mac("zz:zz:zz:zz:zz:zz"))
+
+
+class AnalyzeBadBssidTest(unittest.TestCase):
+    def setUp(self):
+        app = Flask(__name__)
+        app.register_blueprint(analysis_bp)
+        self.client = app.test_client()
+
+    def test_non_hex_bssid_matches_nothing(self):
+        r = self.client.post(
+            "/api/analysis/analyze",
+            json={"fileUrl": CAPTURE, "bssid": "zz:zz:zz:zz:zz:zz", "ssid": "s"},
+        )
+        self.assertEqual(r.status_code, 200)
+        body = r.get_json()
+        self.assertTrue(body["ok"])
+        self.assertEqual(body["summary"]["totalPacketsAfterFilter"], 0)
+        self.assertEqual(body["flows"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
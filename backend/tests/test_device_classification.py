@@ -0,0 +1,225 @@
+# tests/test_device_classification.py
+# Run from backend/: python -m unittest discover -s tests -t .
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import device_classification as dc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CAPTURES = [
+    os.path.join(BACKEND_DIR, name)
+    for name in (
+        "capture-01.cap",
+        "capture-02.cap",
+        "capture-03.cap",
+        "capture-07.cap",
+        os.path.join("downloads", "capture-03.cap"),
+        os.path.join("downloads", "capture-07.cap"),
+        os.path.join("downloads", "user-06.cap"),
+    )
+]
+SMALL_CAPTURE = os.path.join(BACKEND_DIR, "capture-02.cap")
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RADIOTAP = 127
+
+
+def read_records(pcap_file, count):
+    """First count (header, frame) pairs of a little-endian microsecond pcap."""
+    with open(pcap_file, "rb") as f:
+        data = f.read()
+    records = []
+    pos = 24
+    while len(records) < count:
+        header = data[pos:pos + 16]
+        caplen = struct.unpack("<IIII", header)[2]
+        records.append((header, data[pos + 16:pos + 16 + caplen]))
+        pos += 16 + caplen
+    return records
+
+
+def write_pcap(path, linktype, records):
+    with open(path, "wb") as f:
+        f.write(struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, linktype))
+        for header, frame in records:
+            f.write(header)
+            f.write(frame)
+
+
+def assert_tables_equal(test, actual, expected):
+    test.assertEqual(sorted(actual), sorted(expected))
+    for column in expected:
+        np.testing.assert_array_equal(actual[column], expected[column], err_msg=column)
+
+
+class RawWalkerTest(unittest.TestCase):
+    """The mmap walker must return exactly what the Scapy path returns."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_matches_scapy_on_sample_captures(self):
+        for capture in CAPTURES:
+            with self.subTest(capture=os.path.relpath(capture, BACKEND_DIR)):
+                with open(capture, "rb") as f:
+                    header = f.read(24)
+                # The raw walker is only taken for raw 802.11 pcaps
+                self.assertEqual(struct.unpack("<I", header[20:24])[0], dc.LINKTYPE_IEEE802_11)
+                assert_tables_equal(
+                    self, dc.load_packet_table(capture), dc._load_packet_table_scapy(capture)
+                )
+
+    def test_truncated_last_record(self):
+        records = read_records(SMALL_CAPTURE, 200)
+        # End on a long frame, so half of it still holds a full MAC header
+        records = records[:max(i for i, (_, frame) in enumerate(records) if len(frame) > 100) + 1]
+        path = os.path.join(self.tmp, "truncated.cap")
+        write_pcap(path, dc.LINKTYPE_IEEE802_11, records)
+        # Cut the file inside the last frame: its header still claims the full caplen
+        with open(path, "r+b") as f:
+            f.truncate(os.path.getsize(path) - len(records[-1][1]) // 2)
+
+        table = dc.load_packet_table(path)
+        assert_tables_equal(self, table, dc._load_packet_table_scapy(path))
+        self.assertEqual(len(table["time"]), len(records))
+        self.assertEqual(table["frame_len"][-1], (len(records[-1][1]) + 1) // 2)
+
+    def test_frames_too_short_for_their_header_are_dropped(self):
+        header, frame = read_records(SMALL_CAPTURE, 1)[0]
+        short = struct.pack("<IIII", *struct.unpack("<II", header[:8]), 12, 12)
+        path = os.path.join(self.tmp, "short.cap")
+        # A 12-byte management frame cannot hold addr2/addr3, so Scapy fails on it
+        write_pcap(path, dc.LINKTYPE_IEEE802_11,
+                   [(header, frame), (short, b"\x00" * 12), (header, frame)])
+
+        table = dc.load_packet_table(path)
+        assert_tables_equal(self, table, dc._load_packet_table_scapy(path))
+        self.assertEqual(len(table["time"]), 2)
+
+    def test_radiotap_capture_goes_through_scapy(self):
+        records = read_records(SMALL_CAPTURE, 50)
+        radiotap = struct.pack("<BBHI", 0, 0, 8, 0)  # version, pad, length, no fields
+        wrapped = [
+            (header[:8] + struct.pack("<II", len(frame) + 8, len(frame) + 8), radiotap + frame)
+            for header, frame in records
+        ]
+        raw_path = os.path.join(self.tmp, "raw.cap")
+        radiotap_path = os.path.join(self.tmp, "radiotap.cap")
+        write_pcap(raw_path, dc.LINKTYPE_IEEE802_11, records)
+        write_pcap(radiotap_path, LINKTYPE_RADIOTAP, wrapped)
+
+        with mock.patch.object(dc, "_walk_dot11_pcap") as walker:
+            table = dc.load_packet_table(radiotap_path)
+        walker.assert_not_called()
+
+        expected = dc.load_packet_table(raw_path)
+        for column in ("time", "src_mac", "dst_mac"):
+            np.testing.assert_array_equal(table[column], expected[column], err_msg=column)
+        np.testing.assert_array_equal(table["frame_len"], expected["frame_len"] + 8)
+
+    def test_ethernet_capture_has_no_dot11_frames(self):
+        header = read_records(SMALL_CAPTURE, 1)[0][0]
+        frame = bytes.fromhex("ffffffffffff" "001122334455" "0806") + b"\x00" * 28
+        path = os.path.join(self.tmp, "ethernet.cap")
+        write_pcap(path, LINKTYPE_ETHERNET,
+                   [(header[:8] + struct.pack("<II", len(frame), len(frame)), frame)])
+
+        table = dc.load_packet_table(path)
+        self.assertEqual(len(table["time"]), 0)
+        self.assertEqual(len(table["src_mac"]), 0)
+
+
+class PacketTableCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp, "cache")
+        self.capture = os.path.join(self.tmp, "capture.cap")
+        shutil.copy2(SMALL_CAPTURE, self.capture)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def cache_files(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return sorted(os.listdir(self.cache_dir))
+
+    def load_counting_parses(self, cache_dir):
+        """load_packet_table_cached(), returning (table, number of pcap parses)."""
+        with mock.patch.object(dc, "load_packet_table", wraps=dc.load_packet_table) as parse:
+            table = dc.load_packet_table_cached(self.capture, cache_dir)
+        return table, parse.call_count
+
+    def test_round_trip(self):
+        expected = dc.load_packet_table(self.capture)
+
+        first, parses = self.load_counting_parses(self.cache_dir)
+        self.assertEqual(parses, 1)
+        self.assertEqual(self.cache_files(), [dc.capture_cache_key(self.capture) + ".npz"])
+
+        second, parses = self.load_counting_parses(self.cache_dir)
+        self.assertEqual(parses, 0)
+        assert_tables_equal(self, first, expected)
+        assert_tables_equal(self, second, expected)
+        for column in expected:
+            self.assertEqual(second[column].dtype, expected[column].dtype)
+
+    def test_mtime_change_invalidates(self):
+        self.load_counting_parses(self.cache_dir)
+        st = os.stat(self.capture)
+        os.utime(self.capture, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+        _, parses = self.load_counting_parses(self.cache_dir)
+        self.assertEqual(parses, 1)
+        self.assertEqual(len(self.cache_files()), 2)
+
+    def test_size_change_invalidates(self):
+        self.load_counting_parses(self.cache_dir)
+        st = os.stat(self.capture)
+        with open(self.capture, "ab") as f:
+            f.write(b"\x00" * 8)  # shorter than a record header, ignored by the parser
+        os.utime(self.capture, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+        _, parses = self.load_counting_parses(self.cache_dir)
+        self.assertEqual(parses, 1)
+
+    def test_no_cache_dir(self):
+        _, parses = self.load_counting_parses(None)
+        self.assertEqual(parses, 1)
+        _, parses = self.load_counting_parses(None)
+        self.assertEqual(parses, 1)
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_key_covers_first_64_kib_size_and_mtime_only(self):
+        st = os.stat(self.capture)
+        key = dc.capture_cache_key(self.capture)
+
+        def flip_byte(offset):
+            with open(self.capture, "r+b") as f:
+                f.seek(offset)
+                byte = f.read(1)
+                f.seek(offset)
+                f.write(bytes([byte[0] ^ 0xFF]))
+            os.utime(self.capture, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+        # Same size and mtime: an edit past the hashed prefix is not detected...
+        flip_byte(65536 + 100)
+        self.assertEqual(dc.capture_cache_key(self.capture), key)
+
+        # ...while one inside the first 64 KiB is
+        flip_byte(1000)
+        self.assertNotEqual(dc.capture_cache_key(self.capture), key)
+
+
+if __name__ == "__main__":
+    unittest.main()
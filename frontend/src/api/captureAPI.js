@@ -72,10 +72,8 @@ export const captureAPI = {
         // Step 2 — remove ANSI color codes
         let sanitized = event.data.replace(/\x1B\[[0-9;]*[A-Za-z]/g, "");
 
-        // Step 3 — normalize Windows backslashes safely
-        sanitized = sanitized.replace(/\\/g, "\\\\");
-
-        // Step 4 — sometimes Flask sends multiple JSON objects joined by \n\n
+        // Step 3 — sometimes Flask sends multiple JSON objects joined by \n\n
+        // (frames are built with json.dumps, so backslashes arrive escaped)
         const parts = sanitized.split(/\n+/).filter(Boolean);
 
         for (const part of parts) {